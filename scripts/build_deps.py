@@ -12,29 +12,62 @@
 # - Per-OS sanitization of CMake options (e.g. disable SIMAGE_USE_GDIPLUS on non-Windows).
 # - Never pass empty -DEigen3_DIR= (can confuse CMake).
 # - Probe compile-check: strip Windows-only defines (SOQT_DLL, SIMAGE_DLL) on non-Windows.
+#
+# CI caching (restore-then-skip):
+# - Each built cmake dep records third_party/_build/<name>/.cache-key (source, options, config, compiler, OS).
+# - After a run where all of them are current, third_party/_install/.install-key folds those keys.
+# - `build_deps.py --print-cache-key` computes the same aggregate key up front, so CI can restore
+#   third_party/_install + _build under it; restored deps then hit their .ok markers and are skipped.
 
 import argparse
+import atexit
+import contextlib
+import contextvars
 import fnmatch
+import functools
 import glob
+import hashlib
+import json
 import os
 import platform
 import re
 import shutil
 import subprocess
 import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from pathlib import Path
 
+# PyYAML is only required for deps.yaml; deps.toml / deps.json manifests do not need it.
 try:
     import yaml
 except Exception:
-    print("PyYAML not found. Install with: pip install pyyaml", file=sys.stderr)
-    sys.exit(1)
+    yaml = None
+
+# libyaml-backed loader when PyYAML was built with it (much faster than pure Python).
+if yaml is not None:
+    try:
+        from yaml import CSafeLoader as _YamlLoader
+    except ImportError:
+        from yaml import SafeLoader as _YamlLoader
+
+try:
+    import tomllib  # Python 3.11+
+except ImportError:
+    tomllib = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Paths
 ROOT = Path(__file__).resolve().parents[1]
 TP = ROOT / "third_party"
 BUILD = TP / "_build"
 PREFIX = TP / "_install"
+CACHE = TP / "_cache"
 
 # User overrides (set in main()).
 # Keys: qt_root, boost_root, eigen_root
@@ -45,76 +78,379 @@ USER_OVERRIDES: dict[str, str | None] = {"qt_root": None, "boost_root": None, "e
 # Utility helpers
 # ----------------------------
 
+# (tag, logfile) of the dependency currently being processed; see dep_log().
+_RUN_LOG: contextvars.ContextVar[tuple[str, Path] | None] = contextvars.ContextVar("_RUN_LOG", default=None)
+# Single writer for console output so concurrent runs never interleave within a line.
+_OUTPUT_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def dep_log(tag: str, logfile: Path):
+    """
+    Route run() output for one dependency: lines are echoed to the console with a
+    "[tag] " prefix and appended to logfile (truncated on entry) for offline diagnosis.
+    """
+    _ensure_dir(logfile.parent)
+    logfile.write_text("", encoding="utf-8")
+    token = _RUN_LOG.set((tag, logfile))
+    try:
+        yield
+    finally:
+        _RUN_LOG.reset(token)
+
+
 def run(cmd, cwd=None, env=None):
     env = env or os.environ.copy()
-    try:
-        # Capture output so we can print it on failure (GitHub Actions otherwise hides it sometimes)
-        p = subprocess.run(
+    ctx = _RUN_LOG.get()
+    prefix = f"[{ctx[0]}] " if ctx else ""
+    log_cm = open(ctx[1], "a", encoding="utf-8", buffering=1 << 16) if ctx else contextlib.nullcontext()
+
+    # Stream merged stdout/stderr as it is produced (visible live in CI logs, and
+    # still shown in full when the command fails) instead of buffering it all.
+    with log_cm as log_f:
+        if log_f:
+            log_f.write("$ " + " ".join(str(c) for c in cmd) + "\n")
+        with subprocess.Popen(
             cmd,
             cwd=cwd,
             env=env,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             text=True,
-            check=True,
-        )
-        if p.stdout:
-            print(p.stdout, end="" if p.stdout.endswith("\n") else "\n")
-    except subprocess.CalledProcessError as e:
-        if e.stdout:
-            print(e.stdout, end="" if e.stdout.endswith("\n") else "\n")
-        raise
+            errors="replace",
+        ) as p:
+            for line in p.stdout:
+                if not line.endswith("\n"):
+                    line += "\n"
+                if log_f:
+                    log_f.write(line)
+                with _OUTPUT_LOCK:
+                    sys.stdout.write(prefix + line)
+    sys.stdout.flush()
+    if p.returncode:
+        raise subprocess.CalledProcessError(p.returncode, cmd)
+
+def _atomic_write_if_changed(path: Path, text: str) -> bool:
+    """
+    Write text to path only if the content differs (keeps mtimes stable for tools
+    that watch the file), via a temp file + os.replace so readers never see a
+    half-written file. Returns True when the file was (re)written.
+    """
+    try:
+        if path.read_text(encoding="utf-8") == text:
+            return False
+    except OSError:
+        pass
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+    return True
+
+
+# Background deletions started by discard_tree(); joined (bounded) at exit.
+_TRASH_THREADS: list[threading.Thread] = []
+_TRASH_LOCK = threading.Lock()
+
+
+def discard_tree(path: Path) -> None:
+    """
+    Remove a directory tree without waiting for it: rename it to a sibling
+    "<name>.trash.<pid>.<n>" (a metadata-only operation) and delete that in a
+    background thread. Leftovers from interrupted runs are swept the same way.
+    Falls back to a plain rmtree when the rename is not possible.
+    """
+    with _TRASH_LOCK:
+        trash = path.with_name(f"{path.name}.trash.{os.getpid()}.{len(_TRASH_THREADS)}")
+        try:
+            os.replace(path, trash)
+        except OSError:
+            shutil.rmtree(path)
+            return
+        doomed = [trash] + [p for p in path.parent.glob(f"{glob.escape(path.name)}.trash.*")
+                            if p != trash and not p.name.startswith(f"{path.name}.trash.{os.getpid()}.")]
+        t = threading.Thread(target=lambda: [shutil.rmtree(p, ignore_errors=True) for p in doomed], daemon=True)
+        t.start()
+        _TRASH_THREADS.append(t)
+
+
+def remove_installed_symlinks(bld_dir: Path, link_root: Path) -> int:
+    """
+    Unlink the PREFIX entries a --symlink-install left behind, per the build
+    tree's install_manifest*.txt: absolute links whose target lies under
+    link_root (the dep's BUILD/<name>, holding src/ and build/). Relative links
+    such as the libfoo.so -> libfoo.so.1 namelinks of a plain install are kept.
+    A copy-mode install would otherwise keep the links (CMake sees a link to an
+    unchanged file as up to date), and discarding the build tree would leave
+    them dangling. Returns the number removed.
+    """
+    root = os.path.normcase(os.path.realpath(link_root))
+    removed = 0
+    for manifest in bld_dir.glob("install_manifest*.txt"):
+        try:
+            entries = manifest.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                target = os.readlink(entry) if entry else ""
+            except OSError:
+                continue  # not a link (or gone)
+            if not os.path.isabs(target):
+                continue
+            target = os.path.normcase(os.path.realpath(target))
+            try:
+                if os.path.commonpath([root, target]) != root:
+                    continue
+            except ValueError:  # different drives on Windows
+                continue
+            with contextlib.suppress(OSError):
+                os.unlink(entry)
+                removed += 1
+    return removed
+
+
+def _recorded_install_mode(step_dir: Path) -> str | None:
+    """Install mode ("copy" or "symlink") of the dep's last successful install, if recorded."""
+    try:
+        return (step_dir / ".install-mode").read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+
+def drop_symlink_install(step_dir: Path, bld_dir: Path) -> int:
+    """
+    remove_installed_symlinks() for a dep whose last install may have been a
+    --symlink-install; a no-op once a copy install has been recorded.
+    """
+    if _recorded_install_mode(step_dir) == "copy":
+        return 0
+    return remove_installed_symlinks(bld_dir, step_dir)
+
+
+@atexit.register
+def _join_trash_threads(timeout: float = 60.0) -> None:
+    # Give pending deletions a bounded chance to finish; anything left is swept next time.
+    for t in _TRASH_THREADS:
+        t.join(timeout)
+
 
 def cmake_generator():
-    if platform.system() == "Windows":
-        if shutil.which("ninja"):
-            return ["-G", "Ninja"]
-        return []
-    if shutil.which("ninja"):
-        return ["-G", "Ninja"]
+    # Ninja Multi-Config honours --config at build/install time on every OS, so
+    # the same build tree can serve Release and Debug without reconfiguring.
+    # Without Ninja we keep CMake's default (newest Visual Studio / Makefiles).
+    if _which("ninja"):
+        return ["-G", "Ninja Multi-Config"]
     return []
 
 
+def build_parallel_level(requested: int | None = None, dep_jobs: int = 1) -> int:
+    """
+    Number of parallel build jobs passed to `cmake --build --parallel`: an explicit
+    --parallel N, else the cores shared evenly between the --jobs deps in flight.
+    """
+    if requested:
+        return max(1, requested)
+    return max(1, (os.cpu_count() or 1) // max(1, dep_jobs))
+
+
+def compiler_launcher(mode: str = "auto") -> str | None:
+    """
+    Resolve --compiler-cache to a launcher executable (ccache/sccache) or None.
+    auto prefers sccache, then ccache; an explicitly requested tool must exist.
+    """
+    if mode == "none":
+        return None
+    if mode == "auto":
+        return _which("sccache") or _which("ccache")
+    tool = _which(mode)
+    if not tool:
+        raise SystemExit(f"--compiler-cache {mode}: '{mode}' not found on PATH")
+    return tool
+
+
+def _cached_cmake_generator(bld_dir: Path) -> str | None:
+    """Return CMAKE_GENERATOR recorded in an existing CMakeCache.txt, if any."""
+    return _read_cmake_cache(bld_dir).get("CMAKE_GENERATOR")
+
+
+def _read_cmake_cache(bld_dir: Path) -> dict[str, str]:
+    """Parse bld_dir/CMakeCache.txt into {NAME: value} (types dropped); {} if absent."""
+    try:
+        txt = (bld_dir / "CMakeCache.txt").read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return {}
+    out: dict[str, str] = {}
+    for line in txt.splitlines():
+        if not line or line.startswith(("#", "//")):
+            continue
+        m = re.match(r"([^:=]+)(?::[^=]*)?=(.*)$", line)
+        if m:
+            out[m.group(1)] = m.group(2).strip()
+    return out
+
+
+def _cache_is_valid(bld_dir: Path, src_dir: Path, cmake_cmd: list[str]) -> bool:
+    """
+    True when CMakeCache.txt was configured from src_dir with the same generator
+    and every -DNAME=value we would pass (paths compared with forward slashes).
+    """
+    cache = _read_cmake_cache(bld_dir)
+    if not cache:
+        return False
+
+    def _norm(v: str) -> str:
+        return v.replace("\\", "/").rstrip("/")
+
+    if _norm(cache.get("CMAKE_HOME_DIRECTORY", "")) != _norm(str(src_dir)):
+        return False
+    if "-G" in cmake_cmd and cache.get("CMAKE_GENERATOR") != cmake_cmd[cmake_cmd.index("-G") + 1]:
+        return False
+    for arg in cmake_cmd:
+        if arg.startswith("-D") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            if _norm(cache.get(name.split(":", 1)[0], "")) != _norm(value):
+                return False
+    return True
+
+
 def header_exists(rel_path: str) -> bool:
     return (PREFIX / rel_path).exists()
 
 
-def find_lib_files(lib_base: str):
-    """Return list of matching library files under PREFIX/lib for given base."""
-    libdir = PREFIX / "lib"
-    if not libdir.exists():
-        return []
+@functools.lru_cache(maxsize=None)
+def _lib_patterns(lib_base: str) -> tuple[re.Pattern, ...]:
+    """Compiled platform library-name globs for lib_base (case-insensitive on Windows)."""
     if platform.system() == "Windows":
-        patterns = [f"{lib_base}*.lib", f"{lib_base}*.dll"]
+        globs, flags = [f"{lib_base}*.lib", f"{lib_base}*.dll"], re.IGNORECASE
     elif platform.system() == "Darwin":
-        patterns = [f"lib{lib_base}*.dylib", f"{lib_base}*.a"]
+        globs, flags = [f"lib{lib_base}*.dylib", f"{lib_base}*.a"], 0
     else:
-        patterns = [f"lib{lib_base}*.so*", f"{lib_base}*.a"]
+        globs, flags = [f"lib{lib_base}*.so*", f"{lib_base}*.a"], 0
+    return tuple(re.compile(fnmatch.translate(g), flags) for g in globs)
+
+@functools.lru_cache(maxsize=1)
+def _prefix_lib_names() -> tuple[str, ...]:
+    """
+    Sorted entry names of PREFIX/lib from a single directory read, shared by every
+    library lookup; _stat_cache_clear() drops it after an install.
+    """
+    try:
+        with os.scandir(PREFIX / "lib") as it:
+            return tuple(sorted(e.name for e in it))
+    except OSError:
+        return ()
+
 
-    matches = []
-    for fn in os.listdir(libdir):
-        if any(fnmatch.fnmatch(fn, pat) for pat in patterns):
-            matches.append(libdir / fn)
+def find_lib_files(lib_base: str):
+    """Return list of matching library files under PREFIX/lib for given base."""
+    libdir = PREFIX / "lib"
+    patterns = _lib_patterns(lib_base)
+    matches = [libdir / n for n in _prefix_lib_names() if any(r.match(n) for r in patterns)]
 
     # Prefer link libraries over runtime DLLs when both found
     matches.sort(key=lambda p: (p.suffix.lower() in [".dll"], str(p)))
     return matches
 
+
+def _lib_name_candidates(lib_spec) -> list[str]:
+    """verify.lib_name as a list: a single base name or alternatives in preference order."""
+    if isinstance(lib_spec, str):
+        return [lib_spec]
+    if isinstance(lib_spec, (list, tuple)):
+        return list(lib_spec)
+    return []
+
+
+def find_first_lib_files(candidates: list[str]) -> list[Path]:
+    """find_lib_files() for the first candidate base with any match, all from one PREFIX/lib listing."""
+    for base in candidates:
+        matches = find_lib_files(base)
+        if matches:
+            return matches
+    return []
+
+def _subdir_names(path: str | Path) -> set[str] | None:
+    """
+    Names of the subdirectories of path from a single directory read, or None
+    when path is not a readable directory. Replaces per-candidate isdir() stats.
+    """
+    try:
+        with os.scandir(path) as it:
+            return {e.name for e in it if e.is_dir()}
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _isdir_cached(path: str) -> bool:
+    """os.path.isdir, memoized; see _stat_cache_clear()."""
+    return os.path.isdir(path)
+
+
+@functools.lru_cache(maxsize=4096)
+def _isfile_cached(path: str) -> bool:
+    """os.path.isfile, memoized; see _stat_cache_clear()."""
+    return os.path.isfile(path)
+
+
+@functools.lru_cache(maxsize=64)
+def _which_cached(tool: str, path_env: str) -> str | None:
+    """shutil.which over an explicit PATH string, memoized per (tool, PATH)."""
+    return shutil.which(tool, path=path_env)
+
+
+def _which(tool: str, path: str | None = None) -> str | None:
+    """shutil.which(tool, path=path) with the PATH walk cached; see _which_cached()."""
+    if path is None:
+        path = os.environ.get("PATH", os.defpath)
+    return _which_cached(tool, path)
+
+
+# Bumped by _stat_cache_clear(); lets results derived from the filesystem tell a stale answer apart.
+_STAT_GENERATION = 0
+
+
+def _stat_cache_clear() -> None:
+    """Forget memoized isdir/isfile/which answers (at startup and after anything is installed)."""
+    global _STAT_GENERATION
+    _STAT_GENERATION += 1
+    _isdir_cached.cache_clear()
+    _isfile_cached.cache_clear()
+    _which_cached.cache_clear()
+    _prefix_lib_names.cache_clear()
+
+
+def _version_key(name: str) -> tuple[int, ...]:
+    """Numeric sort key for dotted version directory names (14.40.33807, 10.0.22621.0)."""
+    return tuple(int(x) for x in re.findall(r"\d+", name))
+
+
+# Directories this run has already created or found; see _ensure_dir().
+_ENSURED_DIRS: set[str] = set()
+
+
+def _ensure_dir(path: Path) -> Path:
+    """mkdir -p path, once per run: repeat calls for the same directory are free."""
+    key = os.fspath(path)
+    if key not in _ENSURED_DIRS:
+        path.mkdir(parents=True, exist_ok=True)
+        _ENSURED_DIRS.add(key)
+    return path
+
+
 def ensure_install_prefix_dirs() -> None:
     """Create the local install skeleton expected by check probes and CMake hints."""
     for p in (TP, BUILD, PREFIX, PREFIX / "include", PREFIX / "lib", PREFIX / "bin"):
-        p.mkdir(parents=True, exist_ok=True)
+        _ensure_dir(p)
 
+
+@functools.lru_cache(maxsize=1)
 def has_system_simage() -> bool:
     """
     Return True if a usable system simage is available.
     We prefer pkg-config, but also accept header presence as fallback.
     """
-    import shutil
-    import subprocess
-    from pathlib import Path
-
-    pc = shutil.which("pkg-config")
+    pc = _which("pkg-config")
     if pc:
         for name in ("simage", "simage1", "simage-1"):
             r = subprocess.run([pc, "--exists", name])
@@ -128,10 +464,7 @@ def has_system_simage() -> bool:
     )
 
 def system_simage_version() -> str | None:
-    import shutil
-    import subprocess
-
-    pc = shutil.which("pkg-config")
+    pc = _which("pkg-config")
     if not pc:
         return None
 
@@ -147,7 +480,7 @@ def _linux_multiarch_triplet() -> str | None:
     if platform.system() != "Linux":
         return None
     try:
-        if shutil.which("dpkg-architecture"):
+        if _which("dpkg-architecture"):
             return subprocess.check_output(
                 ["dpkg-architecture", "-qDEB_HOST_MULTIARCH"], text=True
             ).strip() or None
@@ -156,6 +489,28 @@ def _linux_multiarch_triplet() -> str | None:
     return None
 
 
+# Debian/Ubuntu multiarch lib subdir per platform.machine().
+_MULTIARCH_LIB_SUBDIRS = {
+    "x86_64": "lib/x86_64-linux-gnu",
+    "aarch64": "lib/aarch64-linux-gnu",
+    "arm64": "lib/aarch64-linux-gnu",
+    "armv7l": "lib/arm-linux-gnueabihf",
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _lib_subdirs() -> tuple[str, ...]:
+    """
+    Library subdirs to search under each prefix: lib and lib64, plus the multiarch
+    dir of this machine on Linux. Other platforms never have lib/<triplet>.
+    """
+    if sys.platform.startswith("linux"):
+        arch_sub = _MULTIARCH_LIB_SUBDIRS.get(platform.machine())
+        if arch_sub:
+            return ("lib", "lib64", arch_sub)
+    return ("lib", "lib64")
+
+
 def _linux_qt6_include_roots() -> list[str]:
     """
     Return likely Qt6 include roots on Ubuntu/Debian:
@@ -188,154 +543,201 @@ def _linux_has_system_qt6() -> bool:
 
 
 # ----------------------------
-# Root overrides + validation
+# Persistent discovery cache
 # ----------------------------
 
-def _norm(p: str) -> str:
-    return os.path.normpath(p)
-
+# Results of toolchain/Qt/Boost/Eigen discovery, reused across runs while the
+# machine fingerprint is unchanged. Only positive results are stored and each is
+# re-checked on disk before use; main() disables it for --no-cache.
+DISCOVERY_CACHE = CACHE / "discovery.json"
+_DISCOVERY_LOCK = threading.Lock()
+_DISCOVERY: dict = {"enabled": True, "entries": None, "dirty": False}
 
-def _validate_qt_root(qt_root: str) -> str:
-    qt_root = _norm(qt_root)
-    qt6_dir = os.path.join(qt_root, "lib", "cmake", "Qt6")
-    if not os.path.isdir(qt_root):
-        raise SystemExit(f"[error] --qt-root points to a non-existing directory: {qt_root}")
-    if not os.path.isdir(qt6_dir):
-        raise SystemExit(
-            f"[error] --qt-root does not look like a Qt prefix (missing {qt6_dir}).\n"
-            r"        Expected something like: C:\Qt\6.x.x\msvc2022_64"
-        )
-    return qt_root
-
-def _validate_eigen_root(eigen_root: str) -> str:
-    eigen_root = _norm(eigen_root)
-    if not os.path.isdir(eigen_root):
-        raise SystemExit(f"[error] --eigen-root points to a non-existing directory: {eigen_root}")
-
-    # Accept multiple layouts:
-    # 1) <root>/Eigen/Core
-    # 2) <root>/include/eigen3/Eigen/Core
-    # 3) <root>/eigen3/Eigen/Core
-    ok = (
-        os.path.isfile(os.path.join(eigen_root, "Eigen", "Core")) or
-        os.path.isfile(os.path.join(eigen_root, "include", "eigen3", "Eigen", "Core")) or
-        os.path.isfile(os.path.join(eigen_root, "eigen3", "Eigen", "Core"))
-    )
-    if not ok:
-        raise SystemExit(
-            f"[error] --eigen-root does not look like Eigen (cannot find Eigen/Core).\n"
-            f"        Checked:\n"
-            f"          {os.path.join(eigen_root, 'Eigen', 'Core')}\n"
-            f"          {os.path.join(eigen_root, 'include', 'eigen3', 'Eigen', 'Core')}\n"
-            f"          {os.path.join(eigen_root, 'eigen3', 'Eigen', 'Core')}\n"
-        )
-    return eigen_root
 
-def _validate_boost_root(boost_root: str) -> str:
-    """
-    Validate and normalize Boost root.
+def _discovery_fingerprint() -> str:
+    """Platform, PATH and the mtimes of the roots where VS and Qt kits get installed."""
+    if platform.system() == "Windows":
+        roots = [r"C:\Program Files\Microsoft Visual Studio",
+                 r"C:\Program Files (x86)\Microsoft Visual Studio", r"C:\Qt"]
+    else:
+        roots = [os.path.join(os.path.expanduser("~"), "Qt")]
+    mtimes = []
+    for r in roots:
+        try:
+            mtimes.append(os.stat(r).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    payload = json.dumps([
+        platform.platform(),
+        hashlib.sha256(os.environ.get("PATH", "").encode("utf-8")).hexdigest(),
+        mtimes,
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _load_discovery_cache() -> dict:
+    """Cached discovery entries, or {} when the file is missing, corrupt or stale. Call under _DISCOVERY_LOCK."""
+    if _DISCOVERY["entries"] is None:
+        entries = {}
+        try:
+            data = json.loads(DISCOVERY_CACHE.read_text(encoding="utf-8"))
+            if data.get("fingerprint") == _discovery_fingerprint():
+                entries = data.get("entries") or {}
+        except (OSError, ValueError, AttributeError):
+            pass
+        _DISCOVERY["entries"] = entries
+    return _DISCOVERY["entries"]
 
-    Accepts common layouts:
-      A) include-root:           <root>/boost/<headers...>
-         examples: /usr/include, /opt/homebrew/include, C:\\vcpkg\\...\\include
 
-      B) prefix-root:            <root>/include/boost/<headers...>
-         examples: C:\\vcpkg\\installed\\x64-windows, custom prefixes
+def _save_discovery_cache() -> None:
+    """Persist entries found during this run (no-op when nothing new was discovered)."""
+    with _DISCOVERY_LOCK:
+        if not (_DISCOVERY["enabled"] and _DISCOVERY["dirty"]):
+            return
+        data = {"fingerprint": _discovery_fingerprint(), "entries": _DISCOVERY["entries"]}
+        _DISCOVERY["dirty"] = False
+    try:
+        DISCOVERY_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write_if_changed(DISCOVERY_CACHE, json.dumps(data, indent=1, sort_keys=True))
+    except OSError:
+        pass
 
-      C) Windows zip layout:     <root>/boost_*/boost/<headers...> (caller passes that folder)
-         examples: C:\\local\\boost_1_84_0
 
-    Returns:
-      The include directory that should be used with -I (or /I on MSVC).
+def _discovered(name: str, key, compute, valid):
+    """
+    compute() with its result remembered in DISCOVERY_CACHE under (name, key).
+    A cached value is returned only while valid(value) holds; empty results are
+    never stored, so newly installed software is still picked up.
     """
-    boost_root = _norm(boost_root)
-    if not os.path.isdir(boost_root):
-        raise SystemExit(f"[error] --boost-root points to a non-existing directory: {boost_root}")
+    if not _DISCOVERY["enabled"]:
+        return compute()
+    ck = f"{name}:{json.dumps(key)}"
+    with _DISCOVERY_LOCK:
+        hit = _load_discovery_cache().get(ck)
+    if hit and valid(hit):
+        return hit
+    value = compute()
+    if value:
+        with _DISCOVERY_LOCK:
+            _load_discovery_cache()[ck] = value
+            _DISCOVERY["dirty"] = True
+    return value
 
-    candidates = []
 
-    # If user passed an include-root directly
-    candidates.append(boost_root)
+# ----------------------------
+# Root overrides + validation
+# ----------------------------
 
-    # If user passed a prefix-root (common for vcpkg/custom installs)
-    candidates.append(os.path.join(boost_root, "include"))
+def _norm(p: str) -> str:
+    return os.path.normpath(p)
 
-    def _looks_like_boost_include(inc: str) -> bool:
-        """
-        Must contain a 'boost' directory. Then try a couple of canonical headers.
-        Fall back to accepting the directory if 'boost' exists (some packaging layouts differ).
-        """
-        bdir = os.path.join(inc, "boost")
-        if not os.path.isdir(bdir):
-            return False
 
-        # Common canonical headers in normal Boost trees
-        canonical = [
-            os.path.join(bdir, "version.hpp"),
-            os.path.join(bdir, "config.hpp"),
-            os.path.join(bdir, "core", "demangle.hpp"),  # another common one
-        ]
-        if any(os.path.isfile(p) for p in canonical):
-            return True
+# Layouts under an Eigen root that hold Eigen/Core; the include root is the
+# directory containing Eigen/.
+_EIGEN_PROBES = (("Eigen", "Core"), ("include", "eigen3", "Eigen", "Core"), ("eigen3", "Eigen", "Core"))
+# Layouts under a Boost root (include root or prefix root) that hold boost/version.hpp.
+_BOOST_PROBES = (("boost", "version.hpp"), ("include", "boost", "version.hpp"))
 
-        # If the boost directory exists but canonical headers aren't present,
-        # still accept it as an include root; some package layouts restructure
-        # (CI/vcpkg-like). Real compile will be the ultimate proof.
-        return True
 
-    for inc in candidates:
-        inc = _norm(inc)
-        if os.path.isdir(inc) and _looks_like_boost_include(inc):
-            return inc
+def _eigen_include_under(root: str | Path) -> str | None:
+    """Include root for Eigen below root (root, root/include/eigen3 or root/eigen3), if any."""
+    for probe in _EIGEN_PROBES:
+        if Path(root, *probe).is_file():
+            return str(Path(root, *probe[:-2]))
+    return None
 
-    # Helpful diagnostics
-    checked = "\n".join(
-        f"          - {os.path.join(_norm(p), 'boost')}"
-        for p in candidates
-    )
+
+def _has_boost_version_header(root: str | Path) -> bool:
+    """True when root is a Boost include root or prefix root."""
+    return any(Path(root, *probe).is_file() for probe in _BOOST_PROBES)
+
+
+# USER_OVERRIDES key -> how to recognise a valid root. `probes` are tried in
+# order relative to the root; `returns` is "root" (the normalized root) or
+# "parent" (the directory containing the first matching probe).
+_ROOT_SPECS = {
+    "qt_root": {
+        "flag": "--qt-root", "label": "Qt root   ", "what": "a Qt prefix",
+        "probes": [("lib", "cmake", "Qt6")], "kind": "dir", "returns": "root",
+        "hint": r"C:\Qt\6.x.x\msvc2022_64",
+    },
+    "boost_root": {
+        # Include root (<root>/boost) or prefix root (<root>/include/boost); the
+        # include directory is returned for -I / /I. Some packaged layouts lack
+        # boost/version.hpp, so the boost/ directory alone is accepted.
+        "flag": "--boost-root", "label": "Boost root", "what": "Boost headers",
+        "probes": [("boost",), ("include", "boost")], "kind": "dir", "returns": "parent",
+        "hint": r"<boost_root>/boost/ or <boost_root>/include/boost/ (e.g. C:\local\boost_1_84_0)",
+    },
+    "eigen_root": {
+        "flag": "--eigen-root", "label": "Eigen root", "what": "Eigen (Eigen/Core)",
+        "probes": list(_EIGEN_PROBES),
+        "kind": "file", "returns": "root",
+        "hint": r"C:\eigen-5.0.0 or a folder containing Eigen/Core",
+    },
+}
+
+
+def _validate_root(key: str, root: str) -> str:
+    """Validate and normalize a --*-root override against _ROOT_SPECS[key]."""
+    spec = _ROOT_SPECS[key]
+    root = _norm(root)
+    if not os.path.isdir(root):
+        raise SystemExit(f"[error] {spec['flag']} points to a non-existing directory: {root}")
+
+    exists = os.path.isdir if spec["kind"] == "dir" else os.path.isfile
+    tried = [os.path.join(root, *probe) for probe in spec["probes"]]
+    for path in tried:
+        if exists(path):
+            return root if spec["returns"] == "root" else os.path.dirname(path)
+
+    checked = "\n".join(f"          - {p}" for p in tried)
     raise SystemExit(
-        "[error] --boost-root does not appear to contain Boost headers.\n"
-        "        Expected either:\n"
-        "          - <boost_root>/boost/ (include root)\n"
-        "          - <boost_root>/include/boost/ (prefix root)\n"
-        "        Checked:\n"
-        f"{checked}"
+        f"[error] {spec['flag']} does not look like {spec['what']}.\n"
+        f"        Expected something like: {spec['hint']}\n"
+        f"        Checked:\n{checked}"
     )
 
+
+class EnvDefault(argparse.Action):
+    """argparse action whose default comes from an environment variable (CLI > env)."""
+
+    def __init__(self, envvar: str, default=None, **kwargs):
+        default = os.environ.get(envvar) or default
+        super().__init__(default=default, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, values)
+
+
 def _apply_overrides_from_env_and_args(args: argparse.Namespace) -> None:
     """
-    Populate USER_OVERRIDES from:
-      - CLI flags (highest priority)
-      - Env vars TONATIUH_QT_ROOT / TONATIUH_BOOST_ROOT / TONATIUH_EIGEN_ROOT
-    Values are validated and normalized if present.
+    Populate USER_OVERRIDES from --qt-root / --boost-root / --eigen-root, whose
+    defaults come from TONATIUH_QT_ROOT / TONATIUH_BOOST_ROOT / TONATIUH_EIGEN_ROOT
+    (see EnvDefault). Values are validated and normalized if present.
     """
-    qt = args.qt_root or os.environ.get("TONATIUH_QT_ROOT")
-    boost = args.boost_root or os.environ.get("TONATIUH_BOOST_ROOT")
-    eigen = args.eigen_root or os.environ.get("TONATIUH_EIGEN_ROOT")
-
-    if qt:
-        USER_OVERRIDES["qt_root"] = _validate_qt_root(qt)
-        print(f"[overrides] Qt root   : {USER_OVERRIDES['qt_root']}")
-    if boost:
-        USER_OVERRIDES["boost_root"] = _validate_boost_root(boost)
-        print(f"[overrides] Boost root: {USER_OVERRIDES['boost_root']}")
-    if eigen:
-        USER_OVERRIDES["eigen_root"] = _validate_eigen_root(eigen)
-        print(f"[overrides] Eigen root: {USER_OVERRIDES['eigen_root']}")
+    for key, spec in _ROOT_SPECS.items():
+        val = getattr(args, key)
+        if val:
+            USER_OVERRIDES[key] = _validate_root(key, val)
+            # stderr: keeps stdout clean for machine-read modes such as --print-cache-key.
+            print(f"[overrides] {spec['label']}: {USER_OVERRIDES[key]}", file=sys.stderr)
 
 
 # ----------------------------
 # Compiler selection
 # ----------------------------
 
+@functools.lru_cache(maxsize=1)
 def choose_cxx():
     r"""
     Pick a C++ compiler that matches our target.
     - Windows: prefer 64-bit cl.exe explicitly if available; fallback to cl on PATH.
     - Others: try c++/g++/clang++ in that order.
+    The choice is cached: it is queried per dependency but cannot change mid-run.
     """
     if platform.system() == "Windows":
-        cl = shutil.which("cl")
+        cl = _which("cl")
         if cl:
             return ("cl", cl)
 
@@ -344,7 +746,7 @@ def choose_cxx():
             return ("cl", cl_from_vs)
 
     for c in ["c++", "g++", "clang++"]:
-        p = shutil.which(c)
+        p = _which(c)
         if p:
             return (c, p)
     return (None, None)
@@ -352,6 +754,7 @@ def choose_cxx():
 
 # ---------- Windows env discovery & normalization ----------
 
+@functools.lru_cache(maxsize=1)
 def _find_vswhere() -> str | None:
     if platform.system() != "Windows":
         return None
@@ -359,6 +762,7 @@ def _find_vswhere() -> str | None:
     return vswhere if os.path.exists(vswhere) else None
 
 
+@functools.lru_cache(maxsize=1)
 def _find_vs_installation_path_latest() -> str | None:
     vswhere = _find_vswhere()
     if not vswhere:
@@ -378,6 +782,7 @@ def _find_vs_installation_path_latest() -> str | None:
         return None
 
 
+@functools.lru_cache(maxsize=1)
 def _find_vsdevcmd():
     """Locate VsDevCmd.bat via vswhere or common paths. Return path or None."""
     if platform.system() != "Windows":
@@ -391,12 +796,8 @@ def _find_vsdevcmd():
 
     candidates = []
     for base in [r"C:\Program Files\Microsoft Visual Studio", r"C:\Program Files (x86)\Microsoft Visual Studio"]:
-        if not os.path.isdir(base):
-            continue
-        for year in os.listdir(base):
+        for year in sorted(_subdir_names(base) or ()):
             ydir = os.path.join(base, year)
-            if not os.path.isdir(ydir):
-                continue
             for edition in ("BuildTools", "Community", "Professional", "Enterprise"):
                 candidates.append(os.path.join(ydir, edition, "Common7", "Tools", "VsDevCmd.bat"))
 
@@ -406,21 +807,21 @@ def _find_vsdevcmd():
     return None
 
 
+@functools.lru_cache(maxsize=1)
 def _find_cl_via_vswhere() -> str | None:
-    """Try to locate HostX64/x64 cl.exe in the latest VS instance."""
+    """Try to locate HostX64/x64 cl.exe in the latest VS instance (remembered across runs)."""
+    return _discovered("cl", None, _find_cl_via_vswhere_uncached, os.path.isfile)
+
+
+def _find_cl_via_vswhere_uncached() -> str | None:
     if platform.system() != "Windows":
         return None
     inst = _find_vs_installation_path_latest()
     if not inst:
         return None
     vc_tools_root = os.path.join(inst, "VC", "Tools", "MSVC")
-    if not os.path.isdir(vc_tools_root):
-        return None
-    versions = sorted(
-        [d for d in os.listdir(vc_tools_root) if os.path.isdir(os.path.join(vc_tools_root, d))],
-        reverse=True
-    )
-    for ver in versions:
+    # Numeric order: 14.40.x must beat 14.9.x.
+    for ver in sorted(_subdir_names(vc_tools_root) or (), key=_version_key, reverse=True):
         cand = os.path.join(vc_tools_root, ver, "bin", "Hostx64", "x64", "cl.exe")
         if os.path.exists(cand):
             return cand
@@ -432,9 +833,34 @@ def _split_paths(val: str):
 
 
 def _join_paths(paths):
-    return os.pathsep.join(paths)
+    """os.pathsep-join paths, dropping empty/None entries."""
+    return os.pathsep.join(p for p in paths if p)
 
 
+def _split_cmake_path_list(val: str | None) -> list[str]:
+    """
+    Split a CMAKE_PREFIX_PATH-style value. ';' (the CMake list separator) is
+    accepted everywhere; ':' only on POSIX, so Windows drive letters
+    (C:/Qt/6.5.0) survive.
+    """
+    seps = r"[;]" if platform.system() == "Windows" else r"[;:]"
+    return [p for p in re.split(seps, val or "") if p]
+
+
+def _ordered_unique(seq):
+    """De-duplicate while preserving first-seen order."""
+    return list(dict.fromkeys(seq))
+
+
+def _ordered_unique_prepend(existing: list[str], new: list[str]) -> list[str]:
+    """new followed by existing, de-duplicated in one pass (first occurrence wins)."""
+    d = dict.fromkeys(new)
+    for p in existing:
+        d.setdefault(p, None)
+    return list(d)
+
+
+@functools.lru_cache(maxsize=1)
 def _probe_sdk_lib_paths():
     """Try to locate Windows 10/11 SDK lib dirs (ucrt/um x64). Return list of LIB paths (may be empty)."""
     roots = [
@@ -445,13 +871,7 @@ def _probe_sdk_lib_paths():
     ]
     candidates = []
     for root in roots:
-        if not os.path.isdir(root):
-            continue
-        try:
-            versions = sorted([d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d))], reverse=True)
-        except Exception:
-            versions = []
-        for ver in versions:
+        for ver in sorted(_subdir_names(root) or (), key=_version_key, reverse=True):
             base = os.path.join(root, ver)
             ucrt = os.path.join(base, "ucrt", "x64")
             um = os.path.join(base, "um", "x64")
@@ -490,7 +910,7 @@ def _is_active_msvc_x64_env(env: dict) -> bool:
     if target_arch and target_arch != "x64":
         return False
 
-    cl = shutil.which("cl", path=env.get("PATH", ""))
+    cl = _which("cl", env.get("PATH", ""))
     if not cl:
         return False
 
@@ -502,77 +922,258 @@ def _is_active_msvc_x64_env(env: dict) -> bool:
     return "\\lib\\x64" in lib_norm or "\\um\\x64" in lib_norm or "\\ucrt\\x64" in lib_norm
 
 
+@functools.lru_cache(maxsize=1)
+def _vswhere_latest_vc_instance() -> dict | None:
+    """Latest VS instance (any product, incl. Build Tools) with the x64 VC tools, from vswhere JSON."""
+    vswhere = _find_vswhere()
+    if not vswhere:
+        return None
+    try:
+        out = subprocess.check_output(
+            [
+                vswhere,
+                "-latest",
+                "-products", "*",
+                "-requires", "Microsoft.VisualStudio.Component.VC.Tools.x86.x64",
+                "-format", "json",
+                "-utf8",
+            ],
+            text=True,
+            encoding="utf-8",
+        )
+        instances = json.loads(out or "[]")
+    except Exception:
+        return None
+    return instances[0] if instances else None
+
+
+def _windows_sdk_root() -> str | None:
+    """Windows 10/11 SDK root (KitsRoot10 from the registry, else the default location)."""
+    try:
+        import winreg
+        with winreg.OpenKey(
+            winreg.HKEY_LOCAL_MACHINE,
+            r"SOFTWARE\Microsoft\Windows Kits\Installed Roots",
+            0,
+            winreg.KEY_READ | winreg.KEY_WOW64_32KEY,
+        ) as key:
+            root, _ = winreg.QueryValueEx(key, "KitsRoot10")
+            if root and os.path.isdir(root):
+                return root
+    except Exception:
+        pass
+    for cand in (r"C:\Program Files (x86)\Windows Kits\10", r"C:\Program Files\Windows Kits\10"):
+        if os.path.isdir(cand):
+            return cand
+    return None
+
+
+def _compute_msvc_env_direct(env_in: dict) -> dict | None:
+    r"""
+    Build the MSVC x64 INCLUDE/LIB/PATH without spawning cmd.exe + VsDevCmd.bat.
+
+    Uses the vswhere installation path, VC\Auxiliary\Build\Microsoft.VCToolsVersion.default.txt
+    and the newest complete Windows SDK. Returns None if any piece is missing so the
+    caller can fall back to VsDevCmd.
+    """
+    inst = _vswhere_latest_vc_instance()
+    install = (inst or {}).get("installationPath")
+    if not install:
+        return None
+
+    ver_file = Path(install) / "VC" / "Auxiliary" / "Build" / "Microsoft.VCToolsVersion.default.txt"
+    try:
+        tools_ver = ver_file.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    vc_tools = os.path.join(install, "VC", "Tools", "MSVC", tools_ver)
+    cl_dir = os.path.join(vc_tools, "bin", "Hostx64", "x64")
+    if not os.path.isfile(os.path.join(cl_dir, "cl.exe")):
+        return None
+
+    sdk_root = _windows_sdk_root()
+    if not sdk_root:
+        return None
+    sdk_ver = None
+    for ver in sorted(_subdir_names(os.path.join(sdk_root, "Include")) or (), key=_version_key, reverse=True):
+        if (os.path.isfile(os.path.join(sdk_root, "Include", ver, "um", "Windows.h"))
+                and os.path.isdir(os.path.join(sdk_root, "Lib", ver, "um", "x64"))):
+            sdk_ver = ver
+            break
+    if not sdk_ver:
+        return None
+
+    sdk_inc = os.path.join(sdk_root, "Include", sdk_ver)
+    sdk_lib = os.path.join(sdk_root, "Lib", sdk_ver)
+    additions = {
+        "INCLUDE": [os.path.join(vc_tools, "include"), os.path.join(vc_tools, "atlmfc", "include")]
+                   + [os.path.join(sdk_inc, sub) for sub in ("ucrt", "shared", "um", "winrt", "cppwinrt")],
+        "LIB": [os.path.join(vc_tools, "lib", "x64"), os.path.join(vc_tools, "atlmfc", "lib", "x64"),
+                os.path.join(sdk_lib, "ucrt", "x64"), os.path.join(sdk_lib, "um", "x64")],
+        # SDK bin provides rc.exe/mt.exe, which CMake needs with the Ninja generator.
+        "PATH": [cl_dir, os.path.join(sdk_root, "bin", sdk_ver, "x64")],
+    }
+
+    new_env = env_in.copy()
+    for key, entries in additions.items():
+        existing = [e for e in entries if os.path.isdir(e)]
+        new_env[key] = _join_paths(existing + _split_paths(new_env.get(key, "")))
+    new_env.update({
+        "VCINSTALLDIR": os.path.join(install, "VC") + os.sep,
+        "VCTOOLSINSTALLDIR": vc_tools + os.sep,
+        "VCTOOLSVERSION": tools_ver,
+        "WINDOWSSDKDIR": sdk_root.rstrip("\\/") + os.sep,
+        "WINDOWSSDKVERSION": sdk_ver + os.sep,
+        "VSCMD_ARG_TGT_ARCH": "x64",
+        "VSCMD_ARG_HOST_ARCH": "x64",
+    })
+    return new_env
+
+
 def load_msvc_env_x64(env_in: dict) -> dict:
-    """Load VS (MSVC) x64 dev environment via VsDevCmd if available."""
+    """
+    Load VS (MSVC) x64 dev environment.
+    Prefer the direct vswhere/filesystem derivation; fall back to VsDevCmd.
+    """
     if platform.system() != "Windows":
         return env_in.copy()
 
     if _is_active_msvc_x64_env(env_in):
         return env_in.copy()
 
+    direct = _compute_msvc_env_direct(env_in)
+    if direct is not None:
+        return direct
+
+    global _MSVC_ENV_DELTA
+    with _MSVC_ENV_LOCK:
+        if _MSVC_ENV_DELTA is None:
+            _MSVC_ENV_DELTA = _vsdevcmd_env_delta(env_in)
+    if not _MSVC_ENV_DELTA:
+        return env_in.copy()
+
+    new_env = env_in.copy()
+    upper = {k.upper(): v for k, v in env_in.items()}
+    for k, (op, value) in _MSVC_ENV_DELTA.items():
+        current = upper.get(k, "")
+        new_env[k] = value + current if op == "prepend" else value
+    return new_env
+
+
+# What VsDevCmd changes in the environment, computed once per process (see
+# _vsdevcmd_env_delta); {} when VsDevCmd is unavailable or failed.
+_MSVC_ENV_DELTA: dict[str, tuple[str, str]] | None = None
+_MSVC_ENV_LOCK = threading.Lock()
+
+# Search-path variables that VsDevCmd extends by prepending to the inherited value.
+_MSVC_PATH_VARS = ("PATH", "LIB", "LIBPATH", "INCLUDE", "EXTERNAL_INCLUDE")
+
+
+def _vsdevcmd_env_delta(env_in: dict) -> dict[str, tuple[str, str]]:
+    """
+    Run VsDevCmd once and return its effect relative to env_in as
+    {NAME: ("prepend", prefix) | ("set", value)}, so later calls can apply it to
+    any environment without spawning cmd.exe again.
+    """
     vsdev = _find_vsdevcmd()
     if not vsdev:
-        return env_in.copy()
+        return {}
 
     cmd = [
         "cmd.exe", "/s", "/c",
         f"\"\"{vsdev}\" -arch=x64 -host_arch=x64 >nul && set\""
     ]
+    before = {k.upper(): v for k, v in env_in.items()}
+    delta: dict[str, tuple[str, str]] = {}
+    # Parse the `set` dump as it streams instead of buffering and re-splitting it.
     try:
-        out = subprocess.check_output(cmd, shell=False, text=True)
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=False, text=True) as proc:
+            for line in proc.stdout:
+                line = line.rstrip("\r\n")
+                if "=" not in line:
+                    continue
+                k, v = line.split("=", 1)
+                k = k.upper()
+                old = before.get(k)
+                if old == v:
+                    continue
+                if k in _MSVC_PATH_VARS and old and v.endswith(old):
+                    delta[k] = ("prepend", v[: len(v) - len(old)])
+                else:
+                    delta[k] = ("set", v)
     except Exception:
-        return env_in.copy()
+        return {}
+    return delta if proc.returncode == 0 else {}
 
-    new_env = env_in.copy()
-    for line in out.splitlines():
-        if "=" in line:
-            k, v = line.split("=", 1)
-            new_env[k.upper()] = v
-    return new_env
+
+# Target architecture of an MSVC / Windows SDK lib or compiler-bin entry (...\lib\x64,
+# ...\um\x86, ...\Hostx64\arm64).
+_ARCH_RE = re.compile(r"\\(?:lib|um|ucrt|hostx\d+|hostarm64)\\(x\d+|arm64)(?=\\|$)", re.IGNORECASE)
+
+
+def _canonicalize_msvc_path_list(raw: str) -> str:
+    """
+    Normalize a Windows PATH/LIB/INCLUDE value in one pass: drop toolchain/lib
+    entries for other targets (x86, arm64), drop duplicates (case- and
+    slash-insensitive, first spelling wins) and move x64 entries ahead of neutral
+    ones while keeping their relative order.
+    """
+    seen: set[str] = set()
+    x64: list[str] = []
+    neutral: list[str] = []
+    for p in raw.split(os.pathsep):
+        if not p:
+            continue
+        pn = p.replace("/", "\\")
+        key = pn.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        m = _ARCH_RE.search(pn)
+        if m is None:
+            neutral.append(p)
+        elif m.group(1).lower() == "x64":
+            x64.append(p)
+    return os.pathsep.join(x64 + neutral)
+
+
+# ensure_msvc_x64_env results keyed by the full input environment.
+_ENV_CACHE: dict[frozenset, dict] = {}
 
 
 def ensure_msvc_x64_env(env_in: dict) -> dict:
     """Ensure MSVC environment points to x64 toolchain/libs."""
-    env = env_in.copy()
     if platform.system() != "Windows":
-        return env
+        return env_in.copy()
 
-    env = load_msvc_env_x64(env)
+    # Every dependency asks for the same environment; compute it once per distinct input.
+    key = frozenset(env_in.items())
+    cached = _ENV_CACHE.get(key)
+    if cached is None:
+        cached = _ENV_CACHE[key] = _ensure_msvc_x64_env_uncached(env_in)
+    return cached.copy()
 
-    def prefer_x64(paths):
-        x64 = []
-        neutral = []
-        for p in paths:
-            low = p.replace("/", "\\").lower()
-            if "\\lib\\x86" in low or "\\hostx86\\x86" in low:
-                continue
-            if "\\lib\\x64" in low or "\\hostx64\\x64" in low:
-                x64.append(p)
-            else:
-                neutral.append(p)
-        return x64 + neutral
+
+def _ensure_msvc_x64_env_uncached(env_in: dict) -> dict:
+    env = env_in.copy()
+
+    env = load_msvc_env_x64(env)
 
     for key in ("LIB", "PATH", "INCLUDE"):
-        vals = _split_paths(env.get(key, ""))
-        if vals:
-            env[key] = _join_paths(prefer_x64(vals))
+        if env.get(key):
+            env[key] = _canonicalize_msvc_path_list(env[key])
 
     cc_name, cc_path = choose_cxx()
     if cc_name == "cl" and cc_path:
         vc_inc, vc_lib = _derive_vc_include_lib_from_cl(cc_path)
         sdk_lib = _probe_sdk_lib_paths()
 
-        if vc_lib:
-            current = _split_paths(env.get("LIB", ""))
-            env["LIB"] = _join_paths(list(dict.fromkeys(vc_lib + current)))
-
-        if sdk_lib:
-            current = _split_paths(env.get("LIB", ""))
-            env["LIB"] = _join_paths(list(dict.fromkeys(sdk_lib + current)))
+        # SDK libs first, then the VC toolset, then whatever LIB already held.
+        if vc_lib or sdk_lib:
+            env["LIB"] = _join_paths(_ordered_unique_prepend(_split_paths(env.get("LIB", "")), sdk_lib + vc_lib))
 
         if vc_inc:
-            current = _split_paths(env.get("INCLUDE", ""))
-            env["INCLUDE"] = _join_paths(list(dict.fromkeys(vc_inc + current)))
+            env["INCLUDE"] = _join_paths(_ordered_unique_prepend(_split_paths(env.get("INCLUDE", "")), vc_inc))
 
     return env
 
@@ -585,17 +1186,10 @@ def _qt6_to_framework_name(lib: str) -> str | None:
 def _find_qt_framework_dirs(prefixes: list[str]) -> list[str]:
     out = []
     for p in prefixes:
-        libdir = Path(p) / "lib"
-        if (libdir / "QtCore.framework").exists():
-            out.append(str(libdir))
-    # de-dupe
-    seen = set()
-    res = []
-    for x in out:
-        if x not in seen:
-            res.append(x)
-            seen.add(x)
-    return res
+        libdir = os.path.join(p, "lib")
+        if os.path.exists(os.path.join(libdir, "QtCore.framework")):
+            out.append(libdir)
+    return _ordered_unique(out)
 
 def resolve_lib_paths(lib_basenames: list[str], prefixes: list[str]) -> list[str]:
     """
@@ -605,46 +1199,46 @@ def resolve_lib_paths(lib_basenames: list[str], prefixes: list[str]) -> list[str
     is_win = platform.system() == "Windows"
     is_mac = platform.system() == "Darwin"
 
+    multiarch_lib_subdirs = _lib_subdirs()
+
+    # List every existing <prefix>/<sub> once, in search order; each base is then
+    # resolved with set lookups instead of a stat per candidate file name.
+    libdirs: list[tuple[str, dict[str, str]]] = []
+    for p in prefixes:
+        for sub in multiarch_lib_subdirs:
+            libdir = os.path.join(p, sub)
+            try:
+                with os.scandir(libdir) as it:
+                    # Windows file names are case-insensitive.
+                    names = {(e.name.lower() if is_win else e.name): e.name for e in it}
+            except OSError:
+                continue
+            libdirs.append((libdir, names))
+
     results = []
-    multiarch_lib_subdirs = [
-        "lib",
-        "lib64",
-        "lib/x86_64-linux-gnu",
-        "lib/aarch64-linux-gnu",
-        "lib/arm-linux-gnueabihf",
-    ]
     for base in lib_basenames or []:
-        found = None
-        for p in prefixes:
-            for sub in multiarch_lib_subdirs:
-                libdir = os.path.join(p, sub)
-                if not os.path.isdir(libdir):
-                    continue
+        if is_win:
+            wanted = [f"{base}.lib".lower(), f"{base}.dll".lower()]
+        elif is_mac:
+            wanted = [f"lib{base}.dylib", f"lib{base}.a"]
+        else:
+            wanted = [f"lib{base}.so", f"lib{base}.a"]
 
-                if is_win:
-                    candidates = [os.path.join(libdir, f"{base}.lib"), os.path.join(libdir, f"{base}.dll")]
-                elif is_mac:
-                    candidates = [
-                        os.path.join(libdir, f"lib{base}.dylib"),
-                        os.path.join(libdir, f"lib{base}.a"),
-                        os.path.join(libdir, f"{base}.framework", "Versions", "A", base),
-                        os.path.join(libdir, f"{base}.framework", base),
-                    ]
-                else:
-                    candidates = [
-                        os.path.join(libdir, f"lib{base}.so"),
-                        os.path.join(libdir, f"lib{base}.a"),
-                    ]
-                    candidates.extend(glob.glob(os.path.join(libdir, f"lib{base}.so.*")))
-
-                for cand in candidates:
-                    if os.path.exists(cand):
-                        found = cand
-                        break
+        found = None
+        for libdir, names in libdirs:
+            hit = next((names[w] for w in wanted if w in names), None)
+            if hit is None and not is_win and not is_mac:
+                versioned = sorted(n for n in names if n.startswith(f"lib{base}.so."))
+                hit = versioned[0] if versioned else None
+            if hit is not None:
+                found = os.path.join(libdir, hit)
+                break
+            if is_mac and f"{base}.framework" in names:
+                fw = os.path.join(libdir, f"{base}.framework")
+                found = next((c for c in (os.path.join(fw, "Versions", "A", base), os.path.join(fw, base))
+                              if os.path.exists(c)), None)
                 if found:
                     break
-            if found:
-                break
         if found:
             results.append(found)
     return results
@@ -660,7 +1254,7 @@ def _brew_prefix(pkg: str) -> str | None:
     """
     if platform.system() != "Darwin":
         return None
-    brew = shutil.which("brew")
+    brew = _which("brew")
     if not brew:
         return None
     try:
@@ -683,23 +1277,15 @@ def detect_eigen_include_root(env: dict) -> str | None:
     """
     if USER_OVERRIDES.get("eigen_root"):
         er = USER_OVERRIDES["eigen_root"]
-        if er:
-            if os.path.isfile(os.path.join(er, "Eigen", "Core")):
-                return er
-            if os.path.isfile(os.path.join(er, "include", "eigen3", "Eigen", "Core")):
-                return os.path.join(er, "include", "eigen3")
-            if os.path.isfile(os.path.join(er, "eigen3", "Eigen", "Core")):
-                return os.path.join(er, "eigen3")
+        inc = _eigen_include_under(er) if er else None
+        if inc:
+            return inc
 
     for key in ("EIGEN3_INCLUDE_DIR", "EIGEN3_ROOT", "EIGEN_ROOT"):
         val = env.get(key)
-        if val and os.path.isdir(val):
-            if os.path.isfile(os.path.join(val, "Eigen", "Core")):
-                return val
-            if os.path.isfile(os.path.join(val, "include", "eigen3", "Eigen", "Core")):
-                return os.path.join(val, "include", "eigen3")
-            if os.path.isfile(os.path.join(val, "eigen3", "Eigen", "Core")):
-                return os.path.join(val, "eigen3")
+        inc = _eigen_include_under(val) if val else None
+        if inc:
+            return inc
 
     cand = PREFIX / "include" / "eigen3"
     if (cand / "Eigen" / "Core").is_file():
@@ -711,6 +1297,21 @@ def detect_eigen_include_root(env: dict) -> str | None:
     if (cand / "Eigen" / "Core").is_file():
         return str(cand)
 
+    return _system_eigen_include_root()
+
+
+@functools.lru_cache(maxsize=1)
+def _system_eigen_include_root() -> str | None:
+    """
+    System/Homebrew/Windows part of detect_eigen_include_root (steps 4-6).
+    These locations do not change while the builder runs, so scan them once
+    (and remember the hit across runs).
+    """
+    return _discovered("eigen_include", None, _system_eigen_include_root_uncached,
+                       lambda p: os.path.isfile(os.path.join(p, "Eigen", "Core")))
+
+
+def _system_eigen_include_root_uncached() -> str | None:
     for p in ("/usr/include/eigen3", "/usr/local/include/eigen3"):
         if os.path.isfile(os.path.join(p, "Eigen", "Core")):
             return p
@@ -733,12 +1334,9 @@ def detect_eigen_include_root(env: dict) -> str | None:
     if platform.system() == "Windows":
         for pat in (r"C:\eigen-*", r"C:\eigen3", r"C:\local\eigen-*", r"C:\local\eigen3"):
             for base in glob.glob(pat):
-                if os.path.isfile(os.path.join(base, "Eigen", "Core")):
-                    return base
-                if os.path.isfile(os.path.join(base, "include", "eigen3", "Eigen", "Core")):
-                    return os.path.join(base, "include", "eigen3")
-                if os.path.isfile(os.path.join(base, "eigen3", "Eigen", "Core")):
-                    return os.path.join(base, "eigen3")
+                inc = _eigen_include_under(base)
+                if inc:
+                    return inc
 
     return None
 
@@ -751,11 +1349,60 @@ def _normalize_to_cmake_path(p: str) -> str:
     return p.replace("\\", "/")
 
 
+@functools.lru_cache(maxsize=256)
 def _qt6_dir_from_prefix(prefix: str) -> str | None:
+    # Qt is never installed by this script, so the answer is stable for the run.
     qt6_dir = os.path.join(prefix, "lib", "cmake", "Qt6")
     return qt6_dir if os.path.isdir(qt6_dir) else None
 
 
+def resolve_qt6_dir(env: dict, prefixes: list[str]) -> str | None:
+    """Qt6_DIR to pass to CMake: env Qt6_DIR/QT6_DIR, else --qt-root, else the first Qt prefix."""
+    qt6_dir_env = env.get("Qt6_DIR") or env.get("QT6_DIR")
+    if qt6_dir_env and os.path.isdir(qt6_dir_env):
+        return qt6_dir_env
+    if USER_OVERRIDES.get("qt_root"):
+        return _qt6_dir_from_prefix(USER_OVERRIDES["qt_root"])  # type: ignore[arg-type]
+    return next((q for q in map(_qt6_dir_from_prefix, prefixes) if q), None)
+
+
+def _qt_version_key(p: str) -> tuple[int, ...]:
+    """Sort key from the 6.x.y component of a Qt prefix path."""
+    for part in Path(p).parts:
+        if part.startswith("6."):
+            return tuple(int(x) for x in part.split(".") if x.isdigit()) or (0,)
+    return (0,)
+
+
+@functools.lru_cache(maxsize=1)
+def _scan_qt_prefixes() -> tuple[str, ...]:
+    """
+    One filesystem scan for installed Qt 6 kits, newest first. The result is
+    invariant for the process lifetime, so it is cached (and remembered across runs).
+    """
+    kits = _discovered("qt_kits", None, lambda: list(_scan_qt_prefixes_uncached()),
+                       lambda v: all(_qt6_dir_from_prefix(p) for p in v))
+    return tuple(kits)
+
+
+def _scan_qt_prefixes_uncached() -> tuple[str, ...]:
+    if platform.system() == "Windows":
+        root = r"C:\Qt"
+        if not os.path.isdir(root):
+            return ()
+        # x64 kits are named msvc<year>_64; msvc<year>_arm64 does not match.
+        candidates = glob.glob(os.path.join(root, "6.*", "msvc*_64"))
+    else:
+        base = os.path.join(os.path.expanduser("~"), "Qt")
+        if not os.path.isdir(base):
+            return ()
+        candidates = glob.glob(os.path.join(base, "6.*", "gcc_64")) + \
+                     glob.glob(os.path.join(base, "6.*", "clang_64"))
+    candidates = [c for c in candidates if _qt6_dir_from_prefix(c)]
+    candidates.sort(key=_qt_version_key, reverse=True)
+    return tuple(candidates)
+
+
 def _detect_qt_prefixes() -> list[str]:
     """
     Auto-detect Qt prefixes.
@@ -763,55 +1410,10 @@ def _detect_qt_prefixes() -> list[str]:
     """
     if USER_OVERRIDES.get("qt_root"):
         return [USER_OVERRIDES["qt_root"]]  # type: ignore[return-value]
-
-    found: list[str] = []
     try:
-        if platform.system() == "Windows":
-            roots = [r"C:\Qt"]
-            patterns = []
-            for root in roots:
-                if os.path.isdir(root):
-                    patterns += [os.path.join(root, "6.*", "msvc*_*")]
-            candidates = []
-            for pat in patterns:
-                candidates += glob.glob(pat)
-
-            candidates = [c for c in candidates if _qt6_dir_from_prefix(c)]
-            candidates = [c for c in candidates if "arm64" not in c.lower()]
-
-            def ver_key(p):
-                for part in Path(p).parts:
-                    if part.startswith("6."):
-                        try:
-                            return tuple(int(x) for x in part.split(".") if x.isdigit())
-                        except Exception:
-                            return (0,)
-                return (0,)
-
-            candidates.sort(key=ver_key, reverse=True)
-            found = candidates
-        else:
-            home = os.path.expanduser("~")
-            base = os.path.join(home, "Qt")
-            if os.path.isdir(base):
-                candidates = glob.glob(os.path.join(base, "6.*", "gcc_64")) + \
-                             glob.glob(os.path.join(base, "6.*", "clang_64"))
-                candidates = [c for c in candidates if _qt6_dir_from_prefix(c)]
-
-                def ver_key(p):
-                    for part in Path(p).parts:
-                        if part.startswith("6."):
-                            try:
-                                return tuple(int(x) for x in part.split(".") if x.isdigit())
-                            except Exception:
-                                return (0,)
-                    return (0,)
-
-                candidates.sort(key=ver_key, reverse=True)
-                found = candidates
+        return list(_scan_qt_prefixes())
     except Exception:
-        pass
-    return found
+        return []
 
 
 def _qt_prefixes_from_env(env: dict) -> list[str]:
@@ -820,7 +1422,7 @@ def _qt_prefixes_from_env(env: dict) -> list[str]:
     if USER_OVERRIDES.get("qt_root"):
         return [USER_OVERRIDES["qt_root"]]  # type: ignore[return-value]
 
-    for p in _split_paths((env.get("CMAKE_PREFIX_PATH", "") or "").replace(";", os.pathsep)):
+    for p in _split_cmake_path_list(env.get("CMAKE_PREFIX_PATH")):
         if _qt6_dir_from_prefix(p):
             prefixes.append(p)
 
@@ -834,13 +1436,7 @@ def _qt_prefixes_from_env(env: dict) -> list[str]:
         except Exception:
             pass
 
-    seen = set()
-    out = []
-    for p in prefixes:
-        if p not in seen:
-            out.append(p)
-            seen.add(p)
-    return out
+    return _ordered_unique(prefixes)
 
 
 def _probe_boost_root(env: dict) -> str | None:
@@ -852,18 +1448,23 @@ def _probe_boost_root(env: dict) -> str | None:
     """
     if USER_OVERRIDES.get("boost_root"):
         return USER_OVERRIDES["boost_root"]
+    return _probe_boost_root_cached(env.get("BOOST_ROOT"), env.get("Boost_ROOT"), platform.system())
 
-    for key in ("BOOST_ROOT", "Boost_ROOT"):
-        val = env.get(key)
-        if val:
-            header = Path(val) / "boost" / "version.hpp"
-            if header.exists():
-                return val
-            header2 = Path(val) / "include" / "boost" / "version.hpp"
-            if header2.exists():
-                return val
 
-    if platform.system() == "Windows":
+@functools.lru_cache(maxsize=None)
+def _probe_boost_root_cached(boost_root: str | None, boost_root_alt: str | None, system: str) -> str | None:
+    """_probe_boost_root() keyed on the only inputs it reads (remembered across runs)."""
+    return _discovered("boost_root", [boost_root, boost_root_alt, system],
+                       lambda: _probe_boost_root_uncached(boost_root, boost_root_alt, system),
+                       _has_boost_version_header)
+
+
+def _probe_boost_root_uncached(boost_root: str | None, boost_root_alt: str | None, system: str) -> str | None:
+    for val in (boost_root, boost_root_alt):
+        if val and _has_boost_version_header(val):
+            return val
+
+    if system == "Windows":
         candidates = []
         for pat in (r"C:\boost_1_*", r"C:\local\boost_1_*"):
             candidates.extend(glob.glob(pat))
@@ -882,56 +1483,80 @@ def _probe_boost_root(env: dict) -> str | None:
     return None
 
 
+# Guards cmake/LocalDepsHints.cmake when deps are processed concurrently (--jobs).
+_HINTS_LOCK = threading.Lock()
+# Inputs of the last LocalDepsHints.cmake write; see _hints_inputs_key().
+_LAST_HINTS_KEY: tuple | None = None
+
+
+def _hints_inputs_key(prefixes: list[str], env: dict) -> tuple:
+    """Everything write_local_hints() output depends on, including the install generation."""
+    return (
+        tuple(prefixes),
+        _prefix_paths_key(env),
+        tuple(env.get(k, "") for k in ("EIGEN3_INCLUDE_DIR", "EIGEN3_ROOT", "EIGEN_ROOT")),
+        _STAT_GENERATION,
+    )
+
+
 def write_local_hints(prefixes: list[str], env: dict | None = None) -> None:
     """
     Write cmake/LocalDepsHints.cmake.
     IMPORTANT: CMAKE_PREFIX_PATH must contain real *prefixes*, not include directories.
     Eigen include is written via EIGEN3_INCLUDE_DIR.
     """
-    cmake_dir = ROOT / "cmake"
-    cmake_dir.mkdir(parents=True, exist_ok=True)
-    hints_path = cmake_dir / "LocalDepsHints.cmake"
-
-    ordered = []
-    seen = set()
-    for p in prefixes:
-        sp = _normalize_to_cmake_path(p)
-        if sp not in seen:
-            ordered.append(sp)
-            seen.add(sp)
-
-    qt6_dir = None
-    for p in ordered:
-        q = _qt6_dir_from_prefix(p)
-        if q:
-            qt6_dir = _normalize_to_cmake_path(q)
-            break
+    global _LAST_HINTS_KEY
+    # Deps finishing concurrently each refresh the hints; serialize compute+write.
+    with _HINTS_LOCK:
+        cmake_dir = ROOT / "cmake"
+        _ensure_dir(cmake_dir)
+        hints_path = cmake_dir / "LocalDepsHints.cmake"
+
+        # Same prefixes, env and nothing installed since the last write: the
+        # file would come out identical, so skip the Qt/Eigen/Boost re-probe too.
+        env2 = env or os.environ.copy()
+        key = _hints_inputs_key(prefixes, env2)
+        if key == _LAST_HINTS_KEY and hints_path.is_file():
+            print(f"[hints] unchanged: {hints_path}")
+            return
 
-    env2 = env or os.environ.copy()
-    eigen_inc = detect_eigen_include_root(env2)
-    if eigen_inc:
-        eigen_inc = _normalize_to_cmake_path(eigen_inc)
+        ordered = _ordered_unique(_normalize_to_cmake_path(p) for p in prefixes)
 
-    boost_root = _probe_boost_root(env2)
-    if boost_root:
-        boost_root = _normalize_to_cmake_path(boost_root)
-
-    lines = []
-    lines.append("# Auto-generated by scripts/build_deps.py")
-    lines.append("# Do not edit by hand; this file may be regenerated.")
-    lines.append("")
-    if ordered:
-        lines.append(f'set(CMAKE_PREFIX_PATH "{(";".join(ordered))}" CACHE PATH "" FORCE)')
-    if qt6_dir:
-        lines.append(f'set(Qt6_DIR "{qt6_dir}" CACHE PATH "" FORCE)')
-    if eigen_inc:
-        lines.append(f'set(EIGEN3_INCLUDE_DIR "{eigen_inc}" CACHE PATH "" FORCE)')
-    if boost_root:
-        lines.append(f'set(BOOST_ROOT "{boost_root}" CACHE PATH "" FORCE)')
-    lines.append("")
+        qt6_dir = None
+        for p in ordered:
+            q = _qt6_dir_from_prefix(p)
+            if q:
+                qt6_dir = _normalize_to_cmake_path(q)
+                break
 
-    hints_path.write_text("\n".join(lines), encoding="utf-8")
-    print(f"[hints] Wrote {hints_path}")
+        eigen_inc = detect_eigen_include_root(env2)
+        if eigen_inc:
+            eigen_inc = _normalize_to_cmake_path(eigen_inc)
+
+        boost_root = _probe_boost_root(env2)
+        if boost_root:
+            boost_root = _normalize_to_cmake_path(boost_root)
+
+        lines = []
+        lines.append("# Auto-generated by scripts/build_deps.py")
+        lines.append("# Do not edit by hand; this file may be regenerated.")
+        lines.append("")
+        if ordered:
+            lines.append(f'set(CMAKE_PREFIX_PATH "{(";".join(ordered))}" CACHE PATH "" FORCE)')
+        if qt6_dir:
+            lines.append(f'set(Qt6_DIR "{qt6_dir}" CACHE PATH "" FORCE)')
+        if eigen_inc:
+            lines.append(f'set(EIGEN3_INCLUDE_DIR "{eigen_inc}" CACHE PATH "" FORCE)')
+        if boost_root:
+            lines.append(f'set(BOOST_ROOT "{boost_root}" CACHE PATH "" FORCE)')
+        lines.append("")
+
+        # Leave an identical file untouched: a new mtime would make CMake reconfigure.
+        if _atomic_write_if_changed(hints_path, "\n".join(lines)):
+            print(f"[hints] Wrote {hints_path}")
+        else:
+            print(f"[hints] unchanged: {hints_path}")
+        _LAST_HINTS_KEY = key
 
 
 # ----------------------------
@@ -956,7 +1581,37 @@ def _default_system_prefixes() -> list[str]:
 
     return out
 
+# get_cmake_prefix_paths results keyed by the inputs it reads (see _prefix_paths_key).
+_PREFIX_PATHS_CACHE: dict[tuple, list[str]] = {}
+
+
+def _prefix_paths_key(env: dict) -> tuple:
+    """Return the env/override values that determine get_cmake_prefix_paths(env)."""
+    env_keys = ("TONATIUH_QT_ROOT", "QT_ROOT_DIR", "CMAKE_PREFIX_PATH", "Qt6_DIR", "QT6_DIR",
+                "BOOST_ROOT", "Boost_ROOT")
+    return (
+        tuple(env.get(k, "") for k in env_keys),
+        tuple(sorted((k, v or "") for k, v in USER_OVERRIDES.items())),
+    )
+
+
 def get_cmake_prefix_paths(env: dict) -> list[str]:
+    """
+    Memoized front-end for _compute_cmake_prefix_paths().
+
+    Discovery globs/stats are invariant for a given environment, so the result is
+    computed once per distinct env fingerprint. A fresh list is returned so callers
+    may append without poisoning the cache.
+    """
+    key = _prefix_paths_key(env)
+    cached = _PREFIX_PATHS_CACHE.get(key)
+    if cached is None:
+        cached = _compute_cmake_prefix_paths(env)
+        _PREFIX_PATHS_CACHE[key] = cached
+    return list(cached)
+
+
+def _compute_cmake_prefix_paths(env: dict) -> list[str]:
     """
     Compute *prefixes* for dependency discovery.
 
@@ -977,29 +1632,33 @@ def get_cmake_prefix_paths(env: dict) -> list[str]:
     def _add(p: str | None) -> None:
         if not p:
             return
-        p = os.path.normpath(p)
-        if p and p not in prefixes:
-            prefixes.append(p)
+        prefixes.append(os.path.normpath(p))
+
+    def _qt_candidates() -> list[str]:
+        # Prefer explicit override / env var set by CI: TONATIUH_QT_ROOT
+        qt_root = USER_OVERRIDES.get("qt_root") or env.get("TONATIUH_QT_ROOT") or env.get("QT_ROOT_DIR")
+        if qt_root and _qt6_dir_from_prefix(qt_root):
+            return [qt_root]
+        return _qt_prefixes_from_env(env) or _detect_qt_prefixes()
+
+    # The Qt, Boost and system-prefix probes are independent filesystem scans
+    # (globs/stats across several roots); overlap them, then merge in priority order.
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        qt_future = pool.submit(_qt_candidates)
+        boost_future = pool.submit(_probe_boost_root, env)
+        system_future = pool.submit(_default_system_prefixes)
 
     # 0) Always start with our install prefix
     _add(str(PREFIX))
 
     # 1) Qt prefix (highest-priority "external" prefix)
-    # Prefer explicit override / env var set by CI: TONATIUH_QT_ROOT
-    qt_root = USER_OVERRIDES.get("qt_root") or env.get("TONATIUH_QT_ROOT") or env.get("QT_ROOT_DIR")
-    if qt_root and _qt6_dir_from_prefix(qt_root):
-        _add(qt_root)
-    else:
-        detected_qt = _qt_prefixes_from_env(env)
-        if not detected_qt:
-            detected_qt = _detect_qt_prefixes()
-        for p in detected_qt:
-            _add(p)
+    for p in qt_future.result():
+        _add(p)
 
     # 2) Boost "prefix"
     # _probe_boost_root may return either a prefix (/usr, C:\boost_*) or an include dir (vcpkg .../include).
     # Normalize include-dir inputs back to the vcpkg prefix when possible.
-    boost_root = _probe_boost_root(env)
+    boost_root = boost_future.result()
     if boost_root:
         br = os.path.normpath(boost_root)
         # vcpkg layout: <prefix>/include/boost/version.hpp
@@ -1010,8 +1669,7 @@ def get_cmake_prefix_paths(env: dict) -> list[str]:
         _add(br)
 
     # 3) Environment CMAKE_PREFIX_PATH entries
-    raw = env.get("CMAKE_PREFIX_PATH", "") or ""
-    for p in [p for p in raw.replace(";", os.pathsep).split(os.pathsep) if p]:
+    for p in _split_cmake_path_list(env.get("CMAKE_PREFIX_PATH")):
         # Skip common "bad" entries that are not prefixes
         low = p.replace("\\", "/").lower()
         if low.endswith("/include") or "/include/" in low:
@@ -1021,7 +1679,7 @@ def get_cmake_prefix_paths(env: dict) -> list[str]:
         _add(p)
 
     # 4) System prefixes
-    for p in _default_system_prefixes():
+    for p in system_future.result():
         _add(p)
 
     # 5) If user passed --eigen-root, add it ONLY if it is a real prefix (not just .../include/eigen3)
@@ -1032,7 +1690,46 @@ def get_cmake_prefix_paths(env: dict) -> list[str]:
         if not (low.endswith("/include/eigen3") or low.endswith("/include")):
             _add(ern)
 
-    return prefixes
+    return _ordered_unique(prefixes)
+
+
+@dataclass(frozen=True)
+class BuildContext:
+    """
+    Discovery results shared by every dep in one run: the toolchain environment
+    (MSVC x64 on Windows), CMake prefixes, Qt6_DIR, Boost/Eigen roots and the C++
+    compiler. None of them change while deps build, so main() computes them once.
+    """
+    env: dict[str, str]
+    prefixes: tuple[str, ...]
+    qt6_dir: str | None
+    boost_root: str | None
+    eigen_include: str | None
+    cc_name: str | None
+    cc_path: str | None
+
+
+def build_context() -> BuildContext:
+    """Run toolchain and prefix discovery for the current environment and overrides."""
+    env = ensure_msvc_x64_env(os.environ.copy())
+    # Prefix discovery (itself Qt/Boost/system scans in parallel), the Eigen sweep
+    # and compiler selection are independent; overlap them. Each is memoized (and
+    # mostly persisted in DISCOVERY_CACHE), so warm runs return almost at once.
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        prefixes_future = pool.submit(get_cmake_prefix_paths, env)
+        eigen_future = pool.submit(detect_eigen_include_root, env)
+        cc_future = pool.submit(choose_cxx)
+    prefixes = prefixes_future.result()
+    cc_name, cc_path = cc_future.result()
+    return BuildContext(
+        env=env,
+        prefixes=tuple(prefixes),
+        qt6_dir=resolve_qt6_dir(env, prefixes),
+        boost_root=_probe_boost_root(env),
+        eigen_include=eigen_future.result(),
+        cc_name=cc_name,
+        cc_path=cc_path,
+    )
 
 # ----------------------------
 # Probe compilation helper flags
@@ -1058,70 +1755,75 @@ def add_extra_includes_and_libs_from_prefixes(cmd_list: list[str],
     if platform.system() == "Linux" and _linux_has_system_qt6():
         linux_qt6_roots = _linux_qt6_include_roots()
 
-    multiarch_lib_subdirs = [
-        "lib",
-        "lib64",
-        "lib/x86_64-linux-gnu",
-        "lib/aarch64-linux-gnu",
-        "lib/arm-linux-gnueabihf",
-    ]
+    multiarch_lib_subdirs = _lib_subdirs()
 
     env2 = env or os.environ.copy()
     eigen_inc = detect_eigen_include_root(env2)
-    if eigen_inc and os.path.isdir(eigen_inc):
+    if eigen_inc and _isdir_cached(eigen_inc):
         includes.append(eigen_inc)
 
     for p in prefixes:
         if not p:
             continue
 
-        inc_root = os.path.join(p, "include")
-        lib_roots = [os.path.join(p, sub) for sub in multiarch_lib_subdirs]
+        # One read of the prefix (and of lib/ when present) answers which of the
+        # include/, lib dirs and Eigen/eigen3/boost roots exist, instead of one
+        # stat per candidate; a stale prefix (e.g. an old --qt-root) stops here.
+        top = _subdir_names(p)
+        if top is None:
+            continue
+        if platform.system() == "Windows":
+            top = {n.lower() for n in top}  # case-insensitive, like isdir()
+        lib_children = (_subdir_names(os.path.join(p, "lib")) or set()) if "lib" in top else set()
+        lib_roots = []
+        for sub in multiarch_lib_subdirs:
+            head, _, tail = sub.partition("/")
+            if (tail in lib_children) if tail else (head in top):
+                lib_roots.append(os.path.join(p, sub))
 
-        if os.path.isdir(inc_root):
+        inc_root = os.path.join(p, "include")
+        # One directory read answers the Qt module / eigen3 / boost probes.
+        inc_dirs = _subdir_names(inc_root) if "include" in top else None
+        if inc_dirs is not None:
             includes.append(inc_root)
 
             for mod in qt_modules:
-                mod_inc = os.path.join(inc_root, mod)
-                if os.path.isdir(mod_inc):
-                    includes.append(mod_inc)
+                if mod in inc_dirs:
+                    includes.append(os.path.join(inc_root, mod))
 
-            eigen3_inc = os.path.join(inc_root, "eigen3")
-            if os.path.isdir(eigen3_inc):
-                includes.append(eigen3_inc)
+            if "eigen3" in inc_dirs:
+                includes.append(os.path.join(inc_root, "eigen3"))
 
-            if os.path.isfile(os.path.join(inc_root, "boost", "version.hpp")):
+            if "boost" in inc_dirs and _isfile_cached(os.path.join(inc_root, "boost", "version.hpp")):
                 includes.append(inc_root)
 
-        if os.path.isfile(os.path.join(p, "Eigen", "Core")):
+        # (Windows names in top are lower-cased above.)
+        if ("Eigen" in top or "eigen" in top) and _isfile_cached(os.path.join(p, "Eigen", "Core")):
             includes.append(p)
 
         eigen3_root = os.path.join(p, "eigen3")
-        if os.path.isfile(os.path.join(eigen3_root, "Eigen", "Core")):
+        if "eigen3" in top and _isfile_cached(os.path.join(eigen3_root, "Eigen", "Core")):
             includes.append(eigen3_root)
 
-        if os.path.isfile(os.path.join(p, "boost", "version.hpp")):
+        if "boost" in top and _isfile_cached(os.path.join(p, "boost", "version.hpp")):
             includes.append(p)
 
         for lr in lib_roots:
-            if not os.path.isdir(lr):
-                continue
             libpaths.append(lr)
 
             if sys.platform == "darwin" and not msvc:
+                has_framework = False
                 try:
-                    entries = os.listdir(lr)
+                    with os.scandir(lr) as it:
+                        for de in it:
+                            if not de.name.endswith(".framework"):
+                                continue
+                            has_framework = True
+                            headers_dir = os.path.join(de.path, "Headers")
+                            if _isdir_cached(headers_dir):
+                                includes.append(headers_dir)
                 except PermissionError:
-                    entries = []
-                has_framework = False
-                for name in entries:
-                    if not name.endswith(".framework"):
-                        continue
-                    has_framework = True
-                    fw_path = os.path.join(lr, name)
-                    headers_dir = os.path.join(fw_path, "Headers")
-                    if os.path.isdir(headers_dir):
-                        includes.append(headers_dir)
+                    pass
                 if has_framework:
                     framework_roots.append(lr)
 
@@ -1130,45 +1832,79 @@ def add_extra_includes_and_libs_from_prefixes(cmd_list: list[str],
             includes.append(root)
             for mod in qt_modules:
                 mod_dir = os.path.join(root, mod)
-                if os.path.isdir(mod_dir):
+                if _isdir_cached(mod_dir):
                     includes.append(mod_dir)
 
-    def _dedupe(seq: list[str]) -> list[str]:
-        seen = set()
-        out: list[str] = []
-        for x in seq:
-            if x not in seen:
-                seen.add(x)
-                out.append(x)
-        return out
-
-    includes = _dedupe(includes)
-    libpaths = _dedupe(libpaths)
-    framework_roots = _dedupe(framework_roots)
+    includes = _ordered_unique(includes)
+    libpaths = _ordered_unique(libpaths)
+    framework_roots = _ordered_unique(framework_roots)
 
     if msvc:
-        for inc in includes:
-            cmd_list.append(f"/I{inc}")
-        for lp in libpaths:
-            cmd_list.append(f"/LIBPATH:{lp}")
+        cmd_list += ["/I" + inc for inc in includes]
+        cmd_list += ["/LIBPATH:" + lp for lp in libpaths]
     else:
-        for inc in includes:
-            cmd_list.append(f"-I{inc}")
-        for lp in libpaths:
-            cmd_list.extend(["-L", lp])
-        if framework_roots:
-            for fw_root in framework_roots:
-                cmd_list.append(f"-F{fw_root}")
+        cmd_list += ["-I" + inc for inc in includes]
+        cmd_list += ["-L" + lp for lp in libpaths]
+        cmd_list += ["-F" + fw_root for fw_root in framework_roots]
 
 # ----------------------------
 # Verification (file + compile)
 # ----------------------------
 
-def compile_check(dep: dict):
+# Linked probe binaries, one directory per _probe_cache_key().
+PROBE_CACHE = CACHE / "probes"
+
+_INCLUDE_LINE_RE = re.compile(r'#\s*include\s*[<"]([^>"]+)[>"]')
+
+
+def _probe_cache_key(cmd: list[str], source: str, include_lines: list[str], link_inputs: list) -> str:
+    """
+    Key a compiled probe on everything that affects the binary: the compile/link
+    command (without output), the probe source, the compiler version, and the
+    size/mtime of the headers named in include_lines (resolved against the -I
+    dirs) and of the libraries it links.
+    """
+    include_dirs = [str(a)[2:] for a in cmd if str(a).startswith(("-I", "/I"))]
+    stamps: list[list] = []
+    for line in include_lines:
+        m = _INCLUDE_LINE_RE.search(line)
+        if not m:
+            continue
+        for d in include_dirs:
+            try:
+                st = os.stat(os.path.join(d, m.group(1)))
+            except OSError:
+                continue
+            stamps.append([m.group(1), d, st.st_mtime_ns, st.st_size])
+            break
+    for f in link_inputs:
+        try:
+            st = os.stat(f)
+            stamps.append([str(f), st.st_mtime_ns, st.st_size])
+        except OSError:
+            stamps.append([str(f)])
+    payload = json.dumps({
+        "cmd": [str(c) for c in cmd],
+        "src": source,
+        "cc_ver": _compiler_version(str(cmd[0])),
+        "inputs": stamps,
+    }).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+def _probe_run_key(exe: Path, runtime_lib_dirs) -> str:
+    """Hash of the probe binary plus the runtime library dirs it was run with."""
+    h = hashlib.sha1(exe.read_bytes())
+    h.update("\n".join(sorted(runtime_lib_dirs or ())).encode("utf-8"))
+    return h.hexdigest()
+
+
+def compile_check(dep: dict, force: bool = False, ctx: "BuildContext | None" = None):
     ensure_install_prefix_dirs()
+    ctx = ctx or build_context()
 
     v = dep.get("verify", {}) or {}
-    cc_name, cc = choose_cxx()
+    cc_name, cc = ctx.cc_name, ctx.cc_path
     if not cc:
         raise RuntimeError("No C++ compiler found for compile_check (cl, c++, g++, or clang++).")
 
@@ -1176,7 +1912,7 @@ def compile_check(dep: dict):
 
     inc_lines = "\n".join(cc_opts.get("include_lines", []))
     code = cc_opts.get("code", "int main(){return 0;}")
-    cc_defs = list(cc_opts.get("defines", []))
+    cc_defs = [str(d) for d in cc_opts.get("defines", [])]
     extra_libs = list((cc_opts.get("link_libs") or []))
 
     # Strip Windows-only defines on non-Windows probe builds.
@@ -1185,27 +1921,27 @@ def compile_check(dep: dict):
         cc_defs = [d for d in cc_defs if d not in ("SOQT_DLL", "SIMAGE_DLL")]
 
     work = BUILD / dep["name"] / "probe"
-    work.mkdir(parents=True, exist_ok=True)
+    _ensure_dir(work)
     src = work / "probe.cpp"
-    exe = work / ("probe.exe" if platform.system() == "Windows" else "probe")
-    src.write_text(inc_lines + "\n" + code, encoding="utf-8")
+    exe_name = "probe.exe" if platform.system() == "Windows" else "probe"
+    src_text = inc_lines + "\n" + code
+    src.write_text(src_text, encoding="utf-8")
 
     include_dir = PREFIX / "include"
     lib_dir = PREFIX / "lib"
     bin_dir = PREFIX / "bin"
 
-    lib_base = v.get("lib_name")
-    lib_files = find_lib_files(lib_base) if lib_base else []
-    if lib_base and not lib_files:
-        raise RuntimeError(f"compile_check: could not locate any library matching '{lib_base}' under {lib_dir}")
+    lib_bases = _lib_name_candidates(v.get("lib_name"))
+    lib_files = find_first_lib_files(lib_bases)
+    if lib_bases and not lib_files:
+        raise RuntimeError(f"compile_check: could not locate any library matching {lib_bases!r} under {lib_dir}")
     link_lib = lib_files[0] if lib_files else None
 
-    env = os.environ.copy()
+    env = dict(ctx.env)
     if platform.system() == "Windows":
-        env = ensure_msvc_x64_env(env)
         env["PATH"] = str(bin_dir) + os.pathsep + env.get("PATH", "")
 
-    prefixes = get_cmake_prefix_paths(env)
+    prefixes = list(ctx.prefixes)
 
     # ---- helpers for Qt runtime in headless CI (Linux runners have no DISPLAY) ----
     def _looks_like_qt_probe() -> bool:
@@ -1242,12 +1978,7 @@ def compile_check(dep: dict):
                 candidate_prefixes.append(val)
 
         # De-dup while preserving order
-        seen = set()
-        ordered = []
-        for p in candidate_prefixes:
-            if p and p not in seen:
-                ordered.append(p)
-                seen.add(p)
+        ordered = _ordered_unique(p for p in candidate_prefixes if p)
 
         for p in ordered:
             pth = Path(p)
@@ -1274,9 +2005,9 @@ def compile_check(dep: dict):
     def _add_qt_framework_dir_from_prefix(prefix: str) -> None:
         if not prefix:
             return
-        libp = Path(prefix) / "lib"
-        if (libp / "QtCore.framework").exists():
-            qt_framework_dirs.add(str(libp))
+        libp = os.path.join(prefix, "lib")
+        if os.path.exists(os.path.join(libp, "QtCore.framework")):
+            qt_framework_dirs.add(libp)
 
     if platform.system() == "Darwin":
         # 1) from known prefixes
@@ -1331,8 +2062,7 @@ def compile_check(dep: dict):
             "/Zc:__cplusplus",
             "/permissive-",
         ]
-        for d in cc_defs:
-            cmd.append(f"/D{d}")
+        cmd += ["/D" + d for d in cc_defs]
 
         # Only add our PREFIX include if it exists (Qt/Eigen/Boost may be system-provided)
         if include_dir.is_dir():
@@ -1353,13 +2083,9 @@ def compile_check(dep: dict):
         for p in extra_lib_paths:
             cmd.append(p)
 
-        cmd += [f"/OUT:{exe}"]
-        run(cmd, cwd=str(work), env=env)
-
     else:
         cmd = [cc, "-std=c++17"]
-        for d in cc_defs:
-            cmd.append(f"-D{d}")
+        cmd += ["-D" + d for d in cc_defs]
 
         cmd.append(str(src))
 
@@ -1376,14 +2102,13 @@ def compile_check(dep: dict):
             runtime_lib_dirs.add(str(lib_dir))
 
         for p in prefixes:
-            pr_lib = Path(p) / "lib"
-            if pr_lib.is_dir():
-                runtime_lib_dirs.add(str(pr_lib))
+            pr_lib = os.path.join(p, "lib")
+            if _isdir_cached(pr_lib):
+                runtime_lib_dirs.add(pr_lib)
 
         if link_lib:
-            runtime_lib_dirs.add(str(Path(link_lib).parent))
-        for p in extra_lib_paths:
-            runtime_lib_dirs.add(str(Path(p).parent))
+            runtime_lib_dirs.add(os.path.dirname(link_lib))
+        runtime_lib_dirs.update(os.path.dirname(p) for p in extra_lib_paths)
 
         # macOS: add Qt frameworks if requested
         if platform.system() == "Darwin" and qt_fw_names:
@@ -1395,25 +2120,41 @@ def compile_check(dep: dict):
                     "Tip: ensure install-qt-action ran, and QT_ROOT_DIR is set, or pass --qt-root."
                 )
 
-            for fdir in sorted(qt_framework_dirs):
-                cmd.append(f"-F{fdir}")
-                runtime_lib_dirs.add(fdir)
+            cmd += ["-F" + fdir for fdir in sorted(qt_framework_dirs)]
+            runtime_lib_dirs.update(qt_framework_dirs)
 
             for fw in qt_fw_names:
-                cmd.extend(["-framework", fw])
+                cmd += ("-framework", fw)
 
         # rpaths (macOS uses LC_RPATH; linux uses DT_RUNPATH/DT_RPATH)
-        for rdir in sorted(runtime_lib_dirs):
-            cmd.extend(["-Wl,-rpath," + rdir])
-
-        cmd += ["-o", str(exe)]
+        cmd += ["-Wl,-rpath," + rdir for rdir in sorted(runtime_lib_dirs)]
 
         if link_lib:
             cmd.append(str(link_lib))
         for p in extra_lib_paths:
             cmd.append(p)
 
-        run(cmd, cwd=str(work), env=env)
+    # Shared probe cache: reuse the linked binary when command, source and inputs
+    # are unchanged, and only run it (which still checks runtime library loading).
+    link_inputs = ([link_lib] if link_lib else []) + list(extra_lib_paths)
+    probe_dir = PROBE_CACHE / _probe_cache_key(cmd, src_text, cc_opts.get("include_lines", []), link_inputs)
+    exe = probe_dir / exe_name
+    probe_ok = probe_dir / ".probe-ok"
+    if exe.is_file():
+        # The marker records the hash of the binary that last ran successfully with
+        # the same runtime library dirs; a match means there is nothing left to check.
+        run_key = _probe_run_key(exe, runtime_lib_dirs)
+        with contextlib.suppress(OSError):
+            if not force and probe_ok.read_text(encoding="utf-8").strip() == run_key:
+                print(f"[compile-check] cached OK: {exe}")
+                return
+        print(f"[compile-check] cached:   {exe}")
+    else:
+        probe_dir.mkdir(parents=True, exist_ok=True)
+        tmp_exe = probe_dir / ("tmp-" + exe_name)
+        out_args = [f"/OUT:{tmp_exe}"] if cc_name == "cl" else ["-o", str(tmp_exe)]
+        run(cmd + out_args, cwd=str(work), env=env)
+        os.replace(tmp_exe, exe)
 
     print(f"[compile-check] run:      {exe}")
 
@@ -1434,13 +2175,14 @@ def compile_check(dep: dict):
         _add_qt_plugin_env(env_run)
 
     run([str(exe)], cwd=str(work), env=env_run)
+    probe_ok.write_text(_probe_run_key(exe, runtime_lib_dirs), encoding="utf-8")
     print("[compile-check] OK")
 
 # ----------------------------
 # Install verification
 # ----------------------------
 
-def verify_install(dep: dict) -> None:
+def verify_install(dep: dict, force: bool = False, ctx: "BuildContext | None" = None) -> None:
     v = dep.get("verify", {}) or {}
     check_error = _check_dependency_diagnostic(dep)
     if check_error:
@@ -1449,29 +2191,75 @@ def verify_install(dep: dict) -> None:
     header = v.get("header")
     if header:
         p = PREFIX / header
-        if not p.exists():
+        if not _isfile_cached(str(p)):
             raise RuntimeError(f"Verification failed: header not found: {p}")
 
-    lib_spec = v.get("lib_name")
-    candidates = []
-    if isinstance(lib_spec, str):
-        candidates = [lib_spec]
-    elif isinstance(lib_spec, (list, tuple)):
-        candidates = list(lib_spec)
-
-    if candidates:
-        for base in candidates:
-            matches = find_lib_files(base)
-            if matches:
-                break
-        else:
-            raise RuntimeError(
-                f"Verification failed: none of the libraries {candidates!r} "
-                f"found under {PREFIX/'lib'}"
-            )
+    candidates = _lib_name_candidates(v.get("lib_name"))
+    if candidates and not find_first_lib_files(candidates):
+        raise RuntimeError(
+            f"Verification failed: none of the libraries {candidates!r} "
+            f"found under {PREFIX/'lib'}"
+        )
 
     if v.get("compile_check"):
-        compile_check(dep)
+        compile_check(dep, force=force, ctx=ctx)
+
+
+def _tree_digest(root: Path, h) -> None:
+    """Feed (relative path, size, mtime_ns) of every file under root into hash h."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            full = os.path.join(dirpath, fn)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            h.update(f"{os.path.relpath(full, root)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+
+
+# Environment inputs through which check deps (Qt, Boost, Eigen) resolve outside PREFIX.
+_VERIFY_ENV_KEYS = ("CMAKE_PREFIX_PATH", "Qt6_DIR", "QT6_DIR", "BOOST_ROOT", "Boost_ROOT",
+                    "EIGEN3_INCLUDE_DIR", "EIGEN3_ROOT", "EIGEN_ROOT")
+
+
+def _verify_fingerprint(dep: dict, ctx: BuildContext) -> str:
+    """
+    Hash of the verify spec, compiler identity, overrides, the discovery results
+    and env the probes resolve against (prefixes, Qt6_DIR, Boost, Eigen), and the
+    installed include/lib trees.
+    """
+    h = hashlib.sha256(json.dumps({
+        "verify": dep.get("verify"),
+        "cc": ctx.cc_path,
+        "cc_ver": _compiler_version(ctx.cc_path),
+        "overrides": sorted((k, v or "") for k, v in USER_OVERRIDES.items()),
+        "prefixes": list(ctx.prefixes),
+        "qt6_dir": ctx.qt6_dir,
+        "boost_root": ctx.boost_root,
+        "eigen_include": ctx.eigen_include,
+        "env": {k: ctx.env.get(k, "") for k in _VERIFY_ENV_KEYS},
+    }, sort_keys=True).encode("utf-8"))
+    for sub in ("include", "lib"):
+        _tree_digest(PREFIX / sub, h)
+    return h.hexdigest()
+
+
+def verify_install_cached(dep: dict, force: bool = False, ctx: "BuildContext | None" = None) -> None:
+    """
+    verify_install() unless it already passed with the same toolchain and the same
+    installed files (recorded in BUILD/<name>/.verify). force re-runs everything,
+    including probes whose binaries are cached.
+    """
+    ctx = ctx or build_context()
+    marker = BUILD / dep["name"] / ".verify"
+    fingerprint = _verify_fingerprint(dep, ctx)
+    if not force and _ok_marker_matches(marker, fingerprint):
+        print(f"[verify] {dep['name']}: toolchain and installed files unchanged; skipping verification")
+        return
+    verify_install(dep, force=force, ctx=ctx)
+    _ensure_dir(marker.parent)
+    _atomic_write_if_changed(marker, _ok_marker_text(fingerprint))
 
 
 def _check_dependency_diagnostic(dep: dict) -> str | None:
@@ -1523,14 +2311,13 @@ def _has_eigen_headers(env: dict) -> bool:
         return True
 
     for p in get_cmake_prefix_paths(env):
-        base = Path(p)
         for rel in (
-            Path("Eigen") / "Core",
-            Path("eigen3") / "Eigen" / "Core",
-            Path("include") / "Eigen" / "Core",
-            Path("include") / "eigen3" / "Eigen" / "Core",
+            ("Eigen", "Core"),
+            ("eigen3", "Eigen", "Core"),
+            ("include", "Eigen", "Core"),
+            ("include", "eigen3", "Eigen", "Core"),
         ):
-            if (base / rel).is_file():
+            if _isfile_cached(os.path.join(p, *rel)):
                 return True
 
     return False
@@ -1540,49 +2327,55 @@ def _has_boost_headers(env: dict) -> bool:
     if _probe_boost_root(env):
         return True
 
-    for p in get_cmake_prefix_paths(env):
-        base = Path(p)
-        if (base / "boost" / "version.hpp").is_file():
-            return True
-        if (base / "include" / "boost" / "version.hpp").is_file():
-            return True
-
-    return False
+    return any(_has_boost_version_header(p) for p in get_cmake_prefix_paths(env))
 
 
 # ----------------------------
 # Doctor helpers
 # ----------------------------
 
+# _read_local_hints_qt_bin results keyed by (path, mtime_ns, size) of the hints file.
+_LOCAL_HINTS_CACHE: dict[tuple, str | None] = {}
+_RE_QT6_DIR = re.compile(r'set\(\s*Qt6_DIR\s+"([^"]+)"')
+_RE_CMAKE_PREFIX_PATH = re.compile(r'set\(\s*CMAKE_PREFIX_PATH\s+"([^"]+)"')
+
+
 def _read_local_hints_qt_bin() -> str | None:
     hints = ROOT / "cmake" / "LocalDepsHints.cmake"
-    if not hints.exists():
+    try:
+        st = hints.stat()
+    except OSError:
         return None
+    key = (str(hints), st.st_mtime_ns, st.st_size)
+    if key not in _LOCAL_HINTS_CACHE:
+        _LOCAL_HINTS_CACHE[key] = _parse_local_hints_qt_bin(hints.read_text(encoding="utf-8"))
+    return _LOCAL_HINTS_CACHE[key]
 
-    txt = hints.read_text(encoding="utf-8")
 
-    m = re.search(r'set\(\s*Qt6_DIR\s+"([^"]+)"', txt)
+def _parse_local_hints_qt_bin(txt: str) -> str | None:
+    """Qt bin/ directory named by the Qt6_DIR or CMAKE_PREFIX_PATH hint in txt."""
+    m = _RE_QT6_DIR.search(txt)
     if m:
         qdir = Path(m.group(1))  # .../lib/cmake/Qt6
         qt_prefix = qdir.parent.parent
         qt_bin = qt_prefix / "bin"
-        if qt_bin.exists():
+        if _isdir_cached(str(qt_bin)):
             return str(qt_bin)
 
-    m2 = re.search(r'set\(\s*CMAKE_PREFIX_PATH\s+"([^"]+)"', txt)
+    m2 = _RE_CMAKE_PREFIX_PATH.search(txt)
     if m2:
         for entry in m2.group(1).split(";"):
             p = Path(entry)
-            if (p / "lib" / "cmake" / "Qt6").exists():
+            if _isdir_cached(str(p / "lib" / "cmake" / "Qt6")):
                 cand = p / "bin"
-                if cand.exists():
+                if _isdir_cached(str(cand)):
                     return str(cand)
 
     return None
 
 
 def _find_qt6_moc():
-    p = shutil.which("moc")
+    p = _which("moc")
     if p:
         return p
     candidates = [
@@ -1596,23 +2389,31 @@ def _find_qt6_moc():
 
 
 def _effective_project_path(env: dict) -> str:
-    sys_dirs = [r"C:\Windows\System32", r"C:\Windows"] if platform.system() == "Windows" else ["/usr/bin", "/bin"]
-    entries = list(sys_dirs)
-
-    tp_bin = str(PREFIX / "bin")
-    if os.path.isdir(tp_bin):
-        entries.append(tp_bin)
-
-    qt_bin = _read_local_hints_qt_bin()
-    if not qt_bin:
-        if USER_OVERRIDES.get("qt_root"):
-            cand = os.path.join(USER_OVERRIDES["qt_root"], "bin")  # type: ignore[arg-type]
-            if os.path.isdir(cand):
-                qt_bin = cand
-    if qt_bin:
-        entries.append(qt_bin)
-
-    return _join_paths(entries)
+    sys_dirs = (r"C:\Windows\System32", r"C:\Windows") if platform.system() == "Windows" else ("/usr/bin", "/bin")
+    tp_bin = os.path.join(PREFIX, "bin")
+    qt_root = USER_OVERRIDES.get("qt_root")
+    qt_bin = _read_local_hints_qt_bin() or (os.path.join(qt_root, "bin") if qt_root else None)
+    return _join_paths((
+        *sys_dirs,
+        tp_bin if _isdir_cached(tp_bin) else None,
+        qt_bin if qt_bin and _isdir_cached(qt_bin) else None,
+    ))
+
+
+def _tool_version_line(exe: str, timeout: float = 3) -> str | None:
+    """
+    First line of `exe --version`, or None if it cannot be run. A tool that does
+    not answer within timeout seconds raises subprocess.TimeoutExpired.
+    """
+    try:
+        out = subprocess.run([exe, "--version"], capture_output=True, text=True,
+                             timeout=timeout, check=True).stdout
+    except subprocess.TimeoutExpired:
+        raise
+    except (OSError, subprocess.SubprocessError):
+        return None
+    first, _, _ = out.strip().partition("\n")
+    return first.strip() or None
 
 
 def cmd_doctor():
@@ -1622,28 +2423,39 @@ def cmd_doctor():
     def ok(msg): print(f"  ✔ {msg}")
     def warn(msg): print(f"  ⚠ {msg}")
 
-    git = shutil.which("git")
-    if git:
-        try:
-            out = subprocess.check_output([git, "--version"], text=True).strip()
-            ok(out)
-        except Exception:
-            warn("git found but failed to run --version")
-    else:
-        warn("git not found in PATH")
+    # The --version spawns dominate doctor's start-up; run them side by side.
+    git = _which("git")
+    cmake = _which("cmake")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        git_future = pool.submit(_tool_version_line, git) if git else None
+        cmake_future = pool.submit(_tool_version_line, cmake) if cmake else None
 
-    cmake = shutil.which("cmake")
-    if cmake:
+    def report_version(tool, future, missing, suffix=""):
+        if future is None:
+            warn(missing)
+            return
         try:
-            first = subprocess.check_output([cmake, "--version"], text=True).splitlines()[0].strip()
-            ok(first + " (OK ≥ 3.20)")
-        except Exception:
-            warn("cmake found but failed to run --version")
-    else:
-        warn("cmake not found")
+            line = future.result()
+        except subprocess.TimeoutExpired:
+            warn(f"{tool} found but `{tool} --version` timed out")
+            return
+        if line:
+            ok(line + suffix)
+        else:
+            warn(f"{tool} found but failed to run --version")
+
+    report_version("git", git_future, "git not found in PATH")
+    report_version("cmake", cmake_future, "cmake not found", " (OK ≥ 3.20)")
 
     ok(f"Python {platform.python_version()} (OK ≥ 3.9)")
 
+    if yaml is None:
+        warn("PyYAML not installed (needed only for deps.yaml manifests)")
+    elif _YamlLoader.__name__ == "CSafeLoader":
+        ok(f"PyYAML {yaml.__version__} (libyaml C loader)")
+    else:
+        warn(f"PyYAML {yaml.__version__} without libyaml (pure-Python loader; manifest parsing is slower)")
+
     try:
         (PREFIX / ".probe").write_text("ok", encoding="utf-8")
         (PREFIX / ".probe").unlink(missing_ok=True)
@@ -1653,16 +2465,16 @@ def cmd_doctor():
 
     qt_bin = _read_local_hints_qt_bin()
     if platform.system() == "Windows":
-        if qt_bin and os.path.isfile(os.path.join(qt_bin, "windeployqt.exe")):
+        if qt_bin and _isfile_cached(os.path.join(qt_bin, "windeployqt.exe")):
             ok(f"windeployqt: {os.path.join(qt_bin, 'windeployqt.exe')}")
         else:
-            wdq = shutil.which("windeployqt")
+            wdq = _which("windeployqt")
             if wdq:
                 ok(f"windeployqt: {wdq}")
             else:
                 warn("windeployqt not found (needed only for Windows packaging)")
     else:
-        if qt_bin and os.path.isdir(qt_bin):
+        if qt_bin and _isdir_cached(qt_bin):
             ok(f"Qt bin (hints): {qt_bin}")
         else:
             moc = _find_qt6_moc()
@@ -1672,7 +2484,7 @@ def cmd_doctor():
                 warn("Qt moc not found (Qt meta-object compiler)")
 
     if platform.system() == "Windows":
-        cc = shutil.which("cl")
+        cc = _which("cl")
         if cc:
             ok(f"MSVC compiler on PATH: {cc}")
         else:
@@ -1717,12 +2529,10 @@ def cmd_doctor():
             cand = PREFIX / "bin" / "simage1.dll"
             if cand.exists():
                 found = cand
-        elif platform.system() == "Darwin":
-            dylibs = sorted((PREFIX / "lib").glob("libsimage*.dylib"))
-            found = dylibs[0] if dylibs else None
         else:
-            so_files = sorted((PREFIX / "lib").glob("libsimage.so*"))
-            found = so_files[0] if so_files else None
+            pattern = "libsimage*.dylib" if platform.system() == "Darwin" else "libsimage.so*"
+            name = next((n for n in _prefix_lib_names() if fnmatch.fnmatchcase(n, pattern)), None)
+            found = PREFIX / "lib" / name if name else None
 
         if found:
             ok(f"simage runtime present: {found}")
@@ -1742,6 +2552,111 @@ def cmd_doctor():
     print("=== Doctor complete ===")
 
 
+# ----------------------------
+# Build fingerprints (.ok markers)
+# ----------------------------
+
+@functools.lru_cache(maxsize=None)
+def _compiler_version(cc_path: str | None) -> str:
+    """First line of the compiler's version banner ('' if unavailable)."""
+    if not cc_path:
+        return ""
+    is_cl = os.path.basename(cc_path).lower() in ("cl", "cl.exe")
+    # cl.exe has no --version; it prints its banner to stderr when run bare.
+    cmd = [cc_path] if is_cl else [cc_path, "--version"]
+    try:
+        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           text=True, errors="replace", timeout=30)
+    except Exception:
+        return ""
+    out = (p.stderr if is_cl else p.stdout) or ""
+    return out.strip().splitlines()[0] if out.strip() else ""
+
+
+def _dep_fingerprint(dep: dict, config: str, native_flags: bool, cc_path: str | None,
+                     symlink_install: bool = False) -> str:
+    """
+    SHA-256 of the canonicalized deps.yaml entry (repo, tag, options, verify
+    probe, ...) plus the toolchain: build config, --native, compiler identity,
+    CMake generator, the caller's LIB/INCLUDE, the --*-root overrides and the
+    install mode (copies vs --symlink-install).
+    Any change to the dep's spec or toolchain invalidates its .ok marker.
+    """
+    payload = json.dumps({
+        # depends_on only affects scheduling, not what gets built.
+        "dep": {k: v for k, v in dep.items() if k != "depends_on"},
+        "config": config,
+        "native": bool(native_flags),
+        "cc": cc_path,
+        "cc_ver": _compiler_version(cc_path),
+        "generator": cmake_generator(),
+        "env": {k: os.environ.get(k, "") for k in ("LIB", "INCLUDE")},
+        "overrides": USER_OVERRIDES,
+        "install_mode": "symlink" if symlink_install else "copy",
+    }, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _dep_cache_key(dep: dict, config: str, native_flags: bool) -> str:
+    """
+    CI cache key for one cmake dep: source, options, build config, compiler and
+    OS/arch. Written to BUILD/<name>/.cache-key after a successful build.
+    """
+    cc_path = choose_cxx()[1]
+    payload = json.dumps({
+        "repo": dep.get("repo"),
+        "tag": dep.get("tag"),
+        "opts": dep.get("cmake_options", []),
+        "unity": dep.get("unity", False),
+        "config": config,
+        "native": bool(native_flags),
+        "cc": cc_path,
+        "cc_ver": _compiler_version(cc_path),
+        "os": f"{platform.system()}-{platform.machine()}",
+    }, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+def _aggregate_install_key(dep_keys: list[str]) -> str:
+    """Fold the per-dep cache keys (manifest order) into one key for PREFIX."""
+    return hashlib.sha1("\n".join(dep_keys).encode("utf-8")).hexdigest()
+
+
+def _write_install_key(cmake_deps: list[dict], config: str, native_flags: bool) -> None:
+    """
+    Write PREFIX/.install-key when every cmake dep's .cache-key matches its
+    current inputs; otherwise drop a stale one so CI never saves a partial prefix
+    under a complete-looking key.
+    """
+    install_key = PREFIX / ".install-key"
+    keys = []
+    for dep in cmake_deps:
+        key = _dep_cache_key(dep, config, native_flags)
+        try:
+            recorded = (BUILD / dep["name"] / ".cache-key").read_text(encoding="utf-8").strip()
+        except OSError:
+            recorded = ""
+        if recorded != key:
+            install_key.unlink(missing_ok=True)
+            return
+        keys.append(key)
+    _atomic_write_if_changed(install_key, _aggregate_install_key(keys))
+
+
+def _ok_marker_text(fingerprint: str) -> str:
+    """Contents of a .ok marker recording fingerprint."""
+    return json.dumps({"fingerprint": fingerprint}) + "\n"
+
+
+def _ok_marker_matches(ok_marker: Path, fingerprint: str) -> bool:
+    """True when ok_marker exists and records exactly this fingerprint."""
+    try:
+        data = json.loads(ok_marker.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return isinstance(data, dict) and data.get("fingerprint") == fingerprint
+
+
 # ----------------------------
 # Build step (CMake + Git)
 # ----------------------------
@@ -1757,7 +2672,7 @@ def _macos_sdk_path(env: dict) -> Path | None:
         if sdk.is_dir():
             return sdk
 
-    xcrun = shutil.which("xcrun")
+    xcrun = _which("xcrun")
     if not xcrun:
         return None
 
@@ -2007,108 +2922,546 @@ def _sanitize_cmake_options(dep_name: str, cmake_options: list[str]) -> list[str
     return opts
 
 
-def build_cmake_git(dep: dict, config: str = "Release", native_flags: bool = False):
+def _cmake_option_name(opt: str) -> str:
+    """'-DNAME:TYPE=value' -> 'NAME'."""
+    return opt[2:].split("=", 1)[0].split(":", 1)[0] if opt.startswith("-D") else opt
+
+
+def _default_cmake_options(dep: dict, cmake_options: list[str], native_flags: bool) -> list[str]:
+    """
+    Build-speed defaults appended after the dep's own cmake_options; any option
+    already set in deps.yaml wins.
+      - unity: true (or a batch size) in deps.yaml enables CMake unity builds
+        (opt-in: not every project's translation units survive being concatenated),
+        plus CMAKE_PCH_INSTANTIATE_TEMPLATES for projects that use precompiled headers.
+      - IPO/LTO stays off unless --native asks for a tuned build.
+    """
+    defaults = []
+    unity = dep.get("unity", False)
+    if unity:
+        batch = unity if isinstance(unity, int) and not isinstance(unity, bool) and unity > 0 else 16
+        defaults += [
+            "-DCMAKE_UNITY_BUILD=ON",
+            f"-DCMAKE_UNITY_BUILD_BATCH_SIZE={batch}",
+            "-DCMAKE_PCH_INSTANTIATE_TEMPLATES=ON",
+        ]
+    if not native_flags:
+        defaults.append("-DCMAKE_INTERPROCEDURAL_OPTIMIZATION=OFF")
+    user_keys = {_cmake_option_name(o) for o in cmake_options}
+    return [d for d in defaults if _cmake_option_name(d) not in user_keys]
+
+
+_COMMIT_SHA_RE = re.compile(r"[0-9a-fA-F]{7,40}")
+
+
+def _well_formed_env_prefix_path(env: dict) -> list[str] | None:
+    """
+    Entries of env CMAKE_PREFIX_PATH when it is a proper environment-style list
+    (os.pathsep-separated, no CMake ';' lists on POSIX) that already contains PREFIX;
+    otherwise None.
+    """
+    raw = env.get("CMAKE_PREFIX_PATH") or ""
+    if not raw or (os.pathsep != ";" and ";" in raw):
+        return None
+    entries = [p for p in raw.split(os.pathsep) if p]
+    wanted = os.path.normcase(os.path.normpath(str(PREFIX)))
+    if not any(os.path.normcase(os.path.normpath(p)) == wanted for p in entries):
+        return None
+    return entries
+
+
+def _configure_fingerprint(cmake_cmd: list[str], dep: dict, env: dict) -> str:
+    """Hash of everything that feeds `cmake -S -B`: the full command line, source ref and compiler env."""
+    payload = json.dumps({
+        "cmd": cmake_cmd,
+        "tag": dep.get("tag"),
+        "env": {k: env.get(k, "") for k in ("CC", "CXX", "CFLAGS", "CXXFLAGS", "LDFLAGS", "CMAKE_PREFIX_PATH")},
+    }, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+def _fetch_dep_source(dep: dict, src_dir: Path, step_dir: Path) -> None:
+    """
+    Clone (or re-pin) the dependency source.
+
+    Branch/tag refs are cloned shallow and single-branch; a commit SHA cannot be
+    named by --branch, so it gets a blobless partial clone (full history, file
+    contents fetched only for the checked-out commit) followed by a checkout.
+    Submodules are fetched shallow and in parallel. Network operations use the
+    git wire protocol v2, which only advertises the refs that were asked for. The pinned ref is recorded in
+    <step_dir>/.source-ref so a repo or tag change in deps.yaml (including dropping
+    the tag) re-pins an existing clone.
+    """
+    repo = dep["repo"]
+    tag = dep.get("tag")
+    ref_file = step_dir / ".source-ref"
+    ref = f"{repo}@{tag or ''}"
+    jobs = f"--jobs={os.cpu_count() or 4}"
+    is_sha = bool(tag and _COMMIT_SHA_RE.fullmatch(tag))
+    git = ["git", "-c", "protocol.version=2"]
+
+    if not src_dir.exists():
+        if is_sha:
+            run(git + ["clone", "--filter=blob:none", "--no-checkout", repo, str(src_dir)])
+            run(["git", "checkout", tag], cwd=str(src_dir))
+            run(["git", "submodule", "update", "--init", "--recursive", "--depth=1", jobs], cwd=str(src_dir))
+        else:
+            clone_cmd = git + ["clone", "--depth=1", "--single-branch"]
+            if tag:
+                clone_cmd += ["--branch", tag]
+            clone_cmd += ["--recurse-submodules", "--shallow-submodules", jobs, repo, str(src_dir)]
+            run(clone_cmd)
+        ref_file.write_text(ref, encoding="utf-8")
+        return
+
+    try:
+        recorded = ref_file.read_text(encoding="utf-8").strip()
+    except OSError:
+        # Clone predates ref tracking; trust the existing checkout.
+        ref_file.write_text(ref, encoding="utf-8")
+        return
+
+    if recorded != ref:
+        print(f"[deps] Source ref changed ({recorded} -> {ref}); re-pinning {src_dir}")
+        # The repo URL is part of the ref: point origin at it before fetching. With
+        # no tag the dep tracks the remote's default branch, i.e. its HEAD.
+        run(["git", "remote", "set-url", "origin", repo], cwd=str(src_dir))
+        run(git + ["fetch", "--depth=1", "origin", tag or "HEAD"], cwd=str(src_dir))
+        run(["git", "checkout", "--detach", "FETCH_HEAD"], cwd=str(src_dir))
+        run(["git", "submodule", "update", "--init", "--recursive", "--depth=1", jobs], cwd=str(src_dir))
+        ref_file.write_text(ref, encoding="utf-8")
+
+
+def build_cmake_git(dep: dict, config: str = "Release", native_flags: bool = False,
+                    compiler_cache: str = "auto", parallel: int | None = None,
+                    verbose: bool = False, profile: bool = False, symlink_install: bool = False,
+                    force_verify: bool = False, ctx: BuildContext | None = None):
     name = dep["name"]
+    ctx = ctx or build_context()
     step_dir = BUILD / name
     src_dir = step_dir / "src"
     bld_dir = step_dir / "build"
     ok_marker = step_dir / ".ok"
 
     ensure_install_prefix_dirs()
-    step_dir.mkdir(parents=True, exist_ok=True)
+    _ensure_dir(step_dir)
 
-    if not src_dir.exists():
-        run(["git", "clone", "--recurse-submodules", dep["repo"], str(src_dir)])
-        if dep.get("tag"):
-            run(["git", "fetch", "--tags"], cwd=str(src_dir))
-            run(["git", "checkout", dep["tag"]], cwd=str(src_dir))
+    _fetch_dep_source(dep, src_dir, step_dir)
 
     gen = cmake_generator()
     cmake_opts = _sanitize_cmake_options(name, dep.get("cmake_options", []))
 
+    # CMake refuses to reuse a build tree configured with another generator
+    # (e.g. an older "Ninja" tree after switching to "Ninja Multi-Config", or a
+    # Ninja tree once ninja is no longer on PATH).
+    cached_gen = _cached_cmake_generator(bld_dir)
+    wanted_gen = gen[1] if gen else None
+    if cached_gen and (cached_gen != wanted_gen if wanted_gen else cached_gen.startswith("Ninja")):
+        print(f"[deps] Generator changed ({cached_gen} -> {wanted_gen or 'default'}); removing {bld_dir}")
+        drop_symlink_install(step_dir, bld_dir)
+        discard_tree(bld_dir)
+
     cmake_cmd = [
         "cmake",
         "-S", str(src_dir),
         "-B", str(bld_dir),
         f"-DCMAKE_INSTALL_PREFIX={PREFIX}",
-    ] + gen + cmake_opts
+    ] + gen + cmake_opts + _default_cmake_options(dep, cmake_opts, native_flags)
 
-    env = os.environ.copy()
-    if platform.system() == "Windows":
-        env = ensure_msvc_x64_env(env)
-    elif platform.system() == "Darwin" and env.get("CMAKE_OSX_ARCHITECTURES"):
-        cmake_cmd.append(f"-DCMAKE_OSX_ARCHITECTURES={env['CMAKE_OSX_ARCHITECTURES']}")
+    # Cache variables we derive, emitted once as -DNAME=value after the dep's own options.
+    cache_vars: dict[str, str] = {}
+
+    env = dict(ctx.env)
+    if platform.system() == "Darwin" and env.get("CMAKE_OSX_ARCHITECTURES"):
+        cache_vars["CMAKE_OSX_ARCHITECTURES"] = env["CMAKE_OSX_ARCHITECTURES"]
 
     cmake_cmd.extend(_macos_modern_opengl_cache_args(name, env))
 
+    # Compiler launcher: unchanged translation units come from the object cache on
+    # --force/--clean rebuilds. Launchers only apply to Ninja/Makefile generators.
+    launcher = compiler_launcher(compiler_cache)
+    if launcher and (gen or platform.system() != "Windows"):
+        cache_vars["CMAKE_C_COMPILER_LAUNCHER"] = cache_vars["CMAKE_CXX_COMPILER_LAUNCHER"] = launcher
+        print(f"[deps] Using compiler cache: {launcher}")
+        if platform.system() == "Windows" and Path(launcher).stem.lower() == "ccache":
+            # cl.exe mtimes change with every VS update; hash the compiler binary instead.
+            env.setdefault("CCACHE_COMPILERCHECK", "content")
+
     # Boost
-    boost_root = _probe_boost_root(env)
+    boost_root = ctx.boost_root
     if boost_root:
-        cmake_cmd.append(f"-DBOOST_ROOT={boost_root}")
+        cache_vars["BOOST_ROOT"] = boost_root
         print(f"[deps] Using Boost from: {boost_root}")
     else:
         print("[deps] Warning: Boost not detected automatically.", file=sys.stderr)
 
     # Eigen (header-only): tell CMake where headers are if we can detect them.
     # IMPORTANT: do not pass -DEigen3_DIR= (empty) — that can confuse CMake find logic.
-    eigen_inc = detect_eigen_include_root(env)
+    eigen_inc = ctx.eigen_include
     if eigen_inc:
-        cmake_cmd.append(f"-DEIGEN3_INCLUDE_DIR={eigen_inc}")
-
-    cmake_cmd.append(f"-DCMAKE_BUILD_TYPE={config}")
-
-    cmake_prefixes = get_cmake_prefix_paths(env)
-    if cmake_prefixes:
-        cmake_cmd.append(f"-DCMAKE_PREFIX_PATH={';'.join(cmake_prefixes)}")
+        cache_vars["EIGEN3_INCLUDE_DIR"] = eigen_inc
+
+    cache_vars["CMAKE_BUILD_TYPE"] = config
+
+    cmake_prefixes = list(ctx.prefixes)
+    env_prefixes = _well_formed_env_prefix_path(env)
+    if env_prefixes is not None:
+        # The caller already manages CMAKE_PREFIX_PATH in the environment (and it includes
+        # our PREFIX): augment it there rather than shadowing it with a cache variable.
+        env["CMAKE_PREFIX_PATH"] = os.pathsep.join(_ordered_unique(env_prefixes + cmake_prefixes))
+        # A cache entry from an earlier configure (or a restored CI cache) is searched
+        # before the environment value; drop it so the env list really takes effect.
+        cmake_cmd.append("-UCMAKE_PREFIX_PATH")
+    elif cmake_prefixes:
+        cache_vars["CMAKE_PREFIX_PATH"] = ";".join(_ordered_unique(cmake_prefixes))
 
     # Qt6_DIR (optional but helpful)
-    qt6_dir_env = env.get("Qt6_DIR") or env.get("QT6_DIR")
-    if qt6_dir_env and os.path.isdir(qt6_dir_env):
-        cmake_cmd.append(f"-DQt6_DIR={qt6_dir_env}")
-    else:
-        if USER_OVERRIDES.get("qt_root"):
-            q6 = _qt6_dir_from_prefix(USER_OVERRIDES["qt_root"])  # type: ignore[arg-type]
-            if q6:
-                cmake_cmd.append(f"-DQt6_DIR={q6}")
-        else:
-            for p in cmake_prefixes:
-                q6 = _qt6_dir_from_prefix(p)
-                if q6:
-                    cmake_cmd.append(f"-DQt6_DIR={q6}")
-                    break
+    if ctx.qt6_dir:
+        cache_vars["Qt6_DIR"] = ctx.qt6_dir
 
     if native_flags:
         if platform.system() == "Windows":
-            cmake_cmd += [
-                "-DCMAKE_C_FLAGS_RELEASE=/O2 /DNDEBUG /arch:AVX2",
-                "-DCMAKE_CXX_FLAGS_RELEASE=/O2 /DNDEBUG /arch:AVX2",
-            ]
+            release_flags = "/O2 /DNDEBUG /arch:AVX2"
         else:
-            cmake_cmd += [
-                "-DCMAKE_C_FLAGS_RELEASE=-O3 -DNDEBUG -march=native",
-                "-DCMAKE_CXX_FLAGS_RELEASE=-O3 -DNDEBUG -march=native",
-            ]
+            release_flags = "-O3 -DNDEBUG -march=native"
+        cache_vars["CMAKE_C_FLAGS_RELEASE"] = cache_vars["CMAKE_CXX_FLAGS_RELEASE"] = release_flags
 
-    run(cmake_cmd, env=env)
+    cmake_cmd += [f"-D{k}={v}" for k, v in cache_vars.items()]
+
+    # Reuse an existing build tree when nothing that feeds the configure step has
+    # changed; the generator's own dependency tracking makes the build incremental.
+    # --clean removes the build tree and therefore always forces a fresh configure.
+    cfg_fp_file = bld_dir / ".cfg-fp"
+    cfg_fp = _configure_fingerprint(cmake_cmd, dep, env)
+    try:
+        configured_fp = cfg_fp_file.read_text(encoding="utf-8").strip()
+    except OSError:
+        configured_fp = None
+    if profile:
+        # A profile needs a real configure run; the trace lands next to log.txt.
+        trace = step_dir / "configure.trace.json"
+        run(cmake_cmd + ["--profiling-format=google-trace", f"--profiling-output={trace}"], env=env)
+        cfg_fp_file.write_text(cfg_fp, encoding="utf-8")
+        print(f"[profile] {name}: configure trace written to {trace} (open in chrome://tracing or ui.perfetto.dev)")
+    elif (bld_dir / "CMakeCache.txt").exists() and configured_fp == cfg_fp:
+        print(f"[deps] {name}: configure inputs unchanged; reusing {bld_dir}")
+    elif configured_fp is None and _cache_is_valid(bld_dir, src_dir, cmake_cmd):
+        # Tree configured without a recorded fingerprint (e.g. restored from a CI cache):
+        # trust it when CMakeCache.txt already holds every value we would pass.
+        print(f"[deps] {name}: CMakeCache.txt matches the requested configuration; reusing {bld_dir}")
+        cfg_fp_file.write_text(cfg_fp, encoding="utf-8")
+    else:
+        run(cmake_cmd, env=env)
+        cfg_fp_file.write_text(cfg_fp, encoding="utf-8")
     # CMake has generated build.ninja/cache/link metadata; scrub before build.
     _sanitize_generated_macos_agl_references(name, bld_dir, env)
 
-    if platform.system() == "Windows":
-        run(["cmake", "--build", str(bld_dir), "--config", config], env=env)
-        run(["cmake", "--install", str(bld_dir), "--config", config], env=env)
+    # Nested builds (ExternalProject, try_compile) inherit the level via env.
+    jobs = str(parallel or build_parallel_level())
+    env["CMAKE_BUILD_PARALLEL_LEVEL"] = jobs
+
+    # Ninja Multi-Config (and the multi-config VS generator) honour --config on every OS,
+    # so build and install share one invocation; only the extras differ per platform.
+    build_cmd = ["cmake", "--build", str(bld_dir), "--config", config, "--parallel", jobs]
+    install_cmd = ["cmake", "--install", str(bld_dir), "--config", config]
+    # Release-type installs drop symbols: smaller _install, less I/O for later scans and
+    # CI cache layers. RelWithDebInfo keeps them (that is its point); with MSVC there is
+    # no strip tool and the flag is a no-op, while MinGW toolchains do strip.
+    if config in ("Release", "MinSizeRel"):
+        install_cmd.append("--strip")
+    if verbose:
+        build_cmd.append("--verbose")
+    if platform.system() == "Windows" and not gen:
+        # Visual Studio generator: --parallel only sets MSBuild /m (projects in
+        # parallel); CL_MPCount also lets cl.exe compile each project's files in parallel.
+        build_cmd += ["--", f"/m:{jobs}", f"/p:CL_MPCount={jobs}"]
+        if not verbose:
+            # Console logger: warnings/errors plus the summary instead of per-target chatter.
+            build_cmd.append("/clp:WarningsOnly;ErrorsOnly;Summary;Verbosity=minimal")
+
+    run(build_cmd, env=env)
+    install_env = env
+    relinked = 0
+    if symlink_install:
+        # CMake >= 3.22: install() links files back to the source/build tree instead
+        # of copying them (falls back to a copy where links are not permitted).
+        install_env = dict(env, CMAKE_INSTALL_MODE="ABS_SYMLINK_OR_COPY")
     else:
-        run(["cmake", "--build", str(bld_dir), "--verbose"], env=env)
-        run(["cmake", "--install", str(bld_dir)], env=env)
-
-    write_local_hints(get_cmake_prefix_paths(env), env=env)
-    verify_install(dep)
-    ok_marker.write_text("ok", encoding="utf-8")
+        # Back from a --symlink-install: drop its links so the install copies files.
+        relinked = drop_symlink_install(step_dir, bld_dir)
+    run(install_cmd, env=install_env)
+    _atomic_write_if_changed(step_dir / ".install-mode", "symlink" if symlink_install else "copy")
+    if relinked:
+        print(f"[deps] {name}: replaced {relinked} symlinked install entries with copies")
+    # The install just changed PREFIX; drop memoized stat answers about it.
+    _stat_cache_clear()
+
+    # The prefix list only depends on env/overrides, so the configure-time list is still current.
+    write_local_hints(cmake_prefixes, env=env)
+    verify_install_cached(dep, force=force_verify, ctx=ctx)
+    _atomic_write_if_changed(ok_marker, _ok_marker_text(
+        _dep_fingerprint(dep, config, native_flags, ctx.cc_path, symlink_install=symlink_install)))
+    _atomic_write_if_changed(step_dir / ".cache-key", _dep_cache_key(dep, config, native_flags))
 
 
 # ----------------------------
 # Main
 # ----------------------------
 
+# Manifest candidates, first existing wins; deps.yaml is the canonical one in the repo.
+MANIFEST_CANDIDATES = (TP / "deps.toml", TP / "deps.json", TP / "deps.yaml")
+# Parsed manifest from the previous run, keyed by the manifest's path/mtime/size.
+MANIFEST_CACHE = BUILD / ".deps_cache.json"
+
+
+def manifest_path() -> Path | None:
+    return next((p for p in MANIFEST_CANDIDATES if p.is_file()), None)
+
+
+def _parse_manifest(path: Path) -> dict:
+    """Parse deps.toml (tomllib), deps.json (orjson when installed) or deps.yaml (PyYAML)."""
+    if path.suffix == ".toml":
+        if tomllib is None:
+            raise SystemExit(f"{path.name} needs Python 3.11+ (tomllib)")
+        return tomllib.loads(path.read_text(encoding="utf-8"))
+    if path.suffix == ".json":
+        data = path.read_bytes()
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+    if yaml is None:
+        raise SystemExit("PyYAML not found. Install with: pip install pyyaml")
+    return yaml.load(path.read_text(encoding="utf-8"), Loader=_YamlLoader) or {}
+
+
+@functools.lru_cache(maxsize=1)
+def load_manifest() -> dict:
+    """
+    Parse the dependency manifest once per process. YAML results are also kept in
+    MANIFEST_CACHE (JSON: the manifest is plain data) and reused while the file's
+    mtime and size are unchanged; TOML/JSON manifests are parsed directly.
+    """
+    manifest = manifest_path()
+    if manifest is None:
+        raise SystemExit("Manifest not found at third_party/deps.yaml (or deps.toml / deps.json)")
+    if manifest.suffix != ".yaml":
+        return _parse_manifest(manifest) or {}
+
+    st = manifest.stat()
+    stamp = [str(manifest), st.st_mtime_ns, st.st_size]
+    try:
+        cached = json.loads(MANIFEST_CACHE.read_text(encoding="utf-8"))
+        if cached.get("stamp") == stamp:
+            return cached["spec"]
+    except (OSError, ValueError, AttributeError, KeyError):
+        pass
+
+    spec = _parse_manifest(manifest)
+    with contextlib.suppress(OSError, TypeError):
+        MANIFEST_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = MANIFEST_CACHE.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"stamp": stamp, "spec": spec}), encoding="utf-8")
+        os.replace(tmp, MANIFEST_CACHE)
+    return spec
+
+
+def _refresh_local_hints(ctx: BuildContext) -> None:
+    write_local_hints(list(ctx.prefixes), env=ctx.env)
+
+
+def _uses_system_simage(dep: dict) -> bool:
+    """Linux: prefer system simage (libsimage-dev) to avoid giflib API/prototype mismatches."""
+    return platform.system() == "Linux" and dep["name"].lower() == "simage" and has_system_simage()
+
+
+def _dep_prerequisites(deps: list[dict]) -> dict[str, set[str]]:
+    """
+    Map each dep name to the names it must wait for. `depends_on` in deps.yaml
+    lists them explicitly; a dep without it waits for every dep listed before it
+    (the historical sequential order).
+    """
+    names = [d["name"] for d in deps]
+    out: dict[str, set[str]] = {}
+    for i, dep in enumerate(deps):
+        req = dep.get("depends_on")
+        if req is None:
+            out[dep["name"]] = set(names[:i])
+            continue
+        if not isinstance(req, list) or not all(isinstance(r, str) for r in req):
+            raise SystemExit(f"{dep['name']}: depends_on must be a list of dep names "
+                             f"(e.g. depends_on: [Coin]), got {req!r}")
+        unknown = sorted(set(req) - set(names))
+        if unknown:
+            raise SystemExit(f"{dep['name']}: depends_on lists unknown deps: {', '.join(unknown)}")
+        out[dep["name"]] = set(req)
+    return out
+
+
+def run_dep_graph(deps: list[dict], prereqs: dict[str, set[str]], jobs: int, task) -> None:
+    """
+    Run task(dep) for every dep once its prerequisites have finished, with up to
+    `jobs` deps in flight. Prerequisites outside `deps` (filtered by --only/--from)
+    count as done. Ready deps start in manifest order; after the first failure no
+    new deps start and the error is re-raised once running ones finish.
+    """
+    selected = {d["name"] for d in deps}
+    waiting = {d["name"]: prereqs.get(d["name"], set()) & selected for d in deps}
+    pending = list(deps)
+    running: dict = {}
+    error: BaseException | None = None
+
+    jobs = max(1, jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            if error is None:
+                for dep in [d for d in pending if not waiting[d["name"]]][:jobs - len(running)]:
+                    pending.remove(dep)
+                    running[pool.submit(task, dep)] = dep["name"]
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                exc = fut.exception()
+                if exc is not None:
+                    error = error or exc
+                    continue
+                for reqs in waiting.values():
+                    reqs.discard(name)
+
+    if error is not None:
+        raise error
+    if pending:
+        names = ", ".join(d["name"] for d in pending)
+        raise SystemExit(f"depends_on cycle between: {names}")
+
+
+class _PerThreadStdout:
+    """
+    sys.stdout stand-in while checks run concurrently: threads inside capture()
+    buffer their output and flush it in one piece when done, so each dep's log
+    stays contiguous. Other threads write straight through.
+    """
+
+    def __init__(self, real):
+        self._real = real
+        self._bufs: dict[int, list[str]] = {}
+
+    def write(self, s: str) -> int:
+        buf = self._bufs.get(threading.get_ident())
+        if buf is None:
+            return self._real.write(s)
+        buf.append(s)
+        return len(s)
+
+    def flush(self) -> None:
+        if threading.get_ident() not in self._bufs:
+            self._real.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+    @contextlib.contextmanager
+    def capture(self):
+        tid = threading.get_ident()
+        self._bufs[tid] = buf = []
+        try:
+            yield
+        finally:
+            del self._bufs[tid]
+            with _OUTPUT_LOCK:
+                self._real.write("".join(buf))
+                self._real.flush()
+
+
+def _prerunnable_checks(selected: list[dict], prereqs: dict[str, set[str]]) -> list[dict]:
+    """Selected `kind: check` deps whose selected prerequisites are all such checks too."""
+    names = {d["name"] for d in selected}
+    ready: set[str] = set()
+    out = []
+    for dep in selected:
+        if dep.get("kind", "cmake") == "check" and prereqs.get(dep["name"], set()) & names <= ready:
+            ready.add(dep["name"])
+            out.append(dep)
+    return out
+
+
+def run_checks_concurrently(checks: list[dict], prereqs: dict[str, set[str]], jobs: int, task) -> None:
+    """
+    run_dep_graph() for presence checks, up to `jobs` at a time. Their compile
+    probes only read PREFIX and each uses its own BUILD/<name>/probe directory;
+    output is buffered per dep and printed as each one finishes.
+    """
+    real = sys.stdout
+    proxy = _PerThreadStdout(real)
+
+    def buffered(dep: dict) -> None:
+        with proxy.capture():
+            task(dep)
+
+    sys.stdout = proxy
+    try:
+        run_dep_graph(checks, prereqs, jobs, buffered)
+    finally:
+        sys.stdout = real
+
+
+def _process_dep(dep: dict, args, ctx: BuildContext) -> None:
+    """Build or verify one dependency, honouring its .ok marker, --force and --clean."""
+    name = dep["name"]
+
+    if _uses_system_simage(dep):
+        ver = system_simage_version()
+        msg = f"[deps] Using system simage (pkg-config simage {ver})" if ver else "[deps] Using system simage (pkg-config simage)"
+        print(msg + "; skipping local simage build.")
+
+        step_dir = BUILD / name
+        _ensure_dir(step_dir)
+        _atomic_write_if_changed(step_dir / ".ok", "ok")
+
+        _refresh_local_hints(ctx)
+        return
+
+    print(f"\n=== [{name}] ===")
+    kind = dep.get("kind", "cmake")
+    ok_marker = (BUILD / name / ".ok")
+    # Only cmake deps install anything, so only they depend on the install mode.
+    expected = _dep_fingerprint(dep, args.config, args.native, ctx.cc_path,
+                                symlink_install=args.symlink_install and kind == "cmake")
+    if _ok_marker_matches(ok_marker, expected) and not args.force:
+        print(f"Skipping {name}: already verified (.ok). Use --force to rebuild.")
+        return
+    if ok_marker.exists() and not args.force:
+        print(f"[deps] {name}: inputs changed since the last build (.ok fingerprint mismatch); rebuilding.")
+
+    bld_dir = BUILD / name / "build"
+    if args.clean and bld_dir.exists():
+        print(f"[clean] Removing {bld_dir}")
+        drop_symlink_install(BUILD / name, bld_dir)
+        discard_tree(bld_dir)
+
+    if kind == "cmake":
+        with dep_log(name, BUILD / name / "log.txt"):
+            build_cmake_git(dep, config=args.config, native_flags=args.native,
+                            compiler_cache=args.compiler_cache,
+                            parallel=build_parallel_level(args.parallel, args.jobs),
+                            verbose=args.verbose_build, profile=args.profile,
+                            symlink_install=args.symlink_install, force_verify=args.force_verify, ctx=ctx)
+        print(f"=== [{name}] OK (installed to {PREFIX}) ===")
+        return
+
+    if kind == "check":
+        print(f"[check] Verifying presence of {name} via compile-check…")
+        with dep_log(name, BUILD / name / "log.txt"):
+            verify_install_cached(dep, force=args.force_verify, ctx=ctx)
+        step_dir = BUILD / name
+        _ensure_dir(step_dir)
+        _atomic_write_if_changed(ok_marker, _ok_marker_text(expected))
+        _refresh_local_hints(ctx)
+        print(f"=== [{name}] OK (presence verified) ===")
+        return
+
+    raise SystemExit(f"Unsupported dep kind '{kind}' for {name} in this script.")
+
+
 def main():
     ap = argparse.ArgumentParser(description="Build third-party deps for Tonatiuh++ (incremental)")
 
@@ -2118,34 +3471,74 @@ def main():
 
     ap.add_argument("--only", help="Build only the named dependency")
     ap.add_argument("--from", dest="from_name", help="Start from this dependency (inclusive)")
-    ap.add_argument("--force", action="store_true", help="Force rebuild even if .ok exists")
+    ap.add_argument("--force", action="store_true", help="Force rebuild even if the .ok marker is up to date")
+    ap.add_argument("--force-verify", action="store_true",
+                    help="Re-run install verification and compile probes even if nothing changed")
     ap.add_argument("--native", action="store_true", help="Enable CPU-tuned optimizations (-march:native or /arch:AVX2)")
-    ap.add_argument("--clean", action="store_true", help="Delete the dep's build directory before configuring")
+    ap.add_argument("--clean", action="store_true", help="Delete the dep's build directory (forces a fresh CMake configure)")
     ap.add_argument("--doctor", action="store_true", help="Check env and print diagnostics")
-
-    ap.add_argument("--qt-root", help=r"Qt prefix root (e.g. C:\Qt\6.10.1\msvc2022_64). Overrides auto-detect.")
-    ap.add_argument("--boost-root", help=r"Boost root containing boost/version.hpp (e.g. C:\boost_1_89_0).")
-    ap.add_argument("--eigen-root", help=r"Eigen root (e.g. C:\eigen-5.0.0 or a folder containing Eigen/Core).")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="Process up to N independent deps concurrently (see depends_on in deps.yaml)")
+    ap.add_argument("--check-jobs", type=int, default=os.cpu_count() or 1,
+                    help="Run up to N presence checks (kind: check) concurrently before building (default: CPU cores; 0 runs them in order)")
+    ap.add_argument("--verbose-build", action="store_true",
+                    help="Show full compiler command lines during `cmake --build` (much larger logs)")
+    ap.add_argument("--profile", action="store_true",
+                    help="Profile CMake configure of each built dep (google-trace JSON next to log.txt; add --force to include up-to-date deps)")
+    ap.add_argument("--symlink-install", action="store_true",
+                    help="Install cmake deps as symlinks into third_party/_build instead of copies "
+                         "(faster local iteration; not for packaging)")
+    ap.add_argument("--parallel", type=int, default=None,
+                    help="Build jobs per dep for `cmake --build --parallel` (default: CPU cores / --jobs)")
+    ap.add_argument("--compiler-cache", default="auto", choices=["auto", "ccache", "sccache", "none"],
+                    help="Compiler launcher for cmake deps (auto: sccache or ccache when found)")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Ignore and do not update third_party/_cache/discovery.json (re-run toolchain/Qt/Boost/Eigen discovery)")
+    ap.add_argument("--print-cache-key", action="store_true",
+                    help="Print the aggregate install cache key for the manifest and exit (for CI cache restore)")
+
+    ap.add_argument("--qt-root", action=EnvDefault, envvar="TONATIUH_QT_ROOT",
+                    help=r"Qt prefix root (e.g. C:\Qt\6.10.1\msvc2022_64). Overrides auto-detect. [env: TONATIUH_QT_ROOT]")
+    ap.add_argument("--boost-root", action=EnvDefault, envvar="TONATIUH_BOOST_ROOT",
+                    help=r"Boost root containing boost/version.hpp (e.g. C:\boost_1_89_0). [env: TONATIUH_BOOST_ROOT]")
+    ap.add_argument("--eigen-root", action=EnvDefault, envvar="TONATIUH_EIGEN_ROOT",
+                    help=r"Eigen root (e.g. C:\eigen-5.0.0 or a folder containing Eigen/Core). [env: TONATIUH_EIGEN_ROOT]")
 
     args = ap.parse_args()
 
+    _stat_cache_clear()
     _apply_overrides_from_env_and_args(args)
     ensure_install_prefix_dirs()
+    if args.no_cache:
+        _DISCOVERY["enabled"] = False
 
     if args.doctor:
         cmd_doctor()
         return
 
-    manifest = TP / "deps.yaml"
-    if not manifest.exists():
+    if manifest_path() is None:
         print("Manifest not found at third_party/deps.yaml", file=sys.stderr)
         sys.exit(1)
 
-    env = os.environ.copy()
-    write_local_hints(get_cmake_prefix_paths(env), env=env)
-
-    spec = yaml.safe_load(manifest.read_text(encoding="utf-8")) or {}
+    spec = load_manifest()
     deps = spec.get("deps", [])
+    # cmake deps this run installs into PREFIX (system simage on Linux is not built).
+    cmake_deps = [d for d in deps if d.get("kind", "cmake") == "cmake" and not _uses_system_simage(d)]
+
+    if args.print_cache_key:
+        # CI captures stdout as the key itself; any diagnostics from compiler
+        # discovery go to stderr so the output is exactly one line.
+        with contextlib.redirect_stdout(sys.stderr):
+            key = _aggregate_install_key([_dep_cache_key(d, args.config, args.native) for d in cmake_deps])
+        print(key)
+        return
+
+    # Toolchain and prefix discovery is invariant across deps: do it once up front
+    # and reuse its prefix list for the hints file and every dep below.
+    ctx = build_context()
+    _save_discovery_cache()
+    _refresh_local_hints(ctx)
+
     print(f"Loaded {len(deps)} dependencies:")
     for d in deps:
         print(f" - {d.get('name','<unnamed>')}")
@@ -2154,60 +3547,25 @@ def main():
         print("Manifest is empty.")
         return
 
-    start = args.from_name is None
-    for dep in deps:
-        name = dep["name"]
-
-        # Linux: prefer system simage (libsimage-dev) to avoid giflib API/prototype mismatches
-        if platform.system() == "Linux" and name.lower() == "simage" and has_system_simage():
-            ver = system_simage_version()
-            msg = f"[deps] Using system simage (pkg-config simage {ver})" if ver else "[deps] Using system simage (pkg-config simage)"
-            print(msg + "; skipping local simage build.")
-
-            step_dir = BUILD / name
-            step_dir.mkdir(parents=True, exist_ok=True)
-            (step_dir / ".ok").write_text("ok", encoding="utf-8")
-
-            write_local_hints(get_cmake_prefix_paths(os.environ.copy()), env=os.environ.copy())
-            continue
-
-        if args.only and name != args.only:
-            continue
-
-        if args.from_name and not start:
-            start = (name == args.from_name)
-            if not start:
-                continue
-
-        print(f"\n=== [{name}] ===")
-        ok_marker = (BUILD / name / ".ok")
-        if ok_marker.exists() and not args.force:
-            print(f"Skipping {name}: already verified (.ok). Use --force to rebuild.")
-            continue
-
-        bld_dir = BUILD / name / "build"
-        if args.clean and bld_dir.exists():
-            print(f"[clean] Removing {bld_dir}")
-            shutil.rmtree(bld_dir)
-
-        kind = dep.get("kind", "cmake")
-
-        if kind == "cmake":
-            build_cmake_git(dep, config=args.config, native_flags=args.native)
-            print(f"=== [{name}] OK (installed to {PREFIX}) ===")
-            continue
+    # Resolve --from to a start index once; the selection is then a single pass.
+    # System simage is always recorded, regardless of --only/--from.
+    first = 0
+    if args.from_name:
+        first = next((i for i, d in enumerate(deps) if d["name"] == args.from_name), len(deps))
+    selected = [
+        dep for i, dep in enumerate(deps)
+        if _uses_system_simage(dep) or (i >= first and (not args.only or dep["name"] == args.only))
+    ]
 
-        if kind == "check":
-            print(f"[check] Verifying presence of {name} via compile-check…")
-            verify_install(dep)
-            step_dir = BUILD / name
-            step_dir.mkdir(parents=True, exist_ok=True)
-            (step_dir / ".ok").write_text("ok", encoding="utf-8")
-            write_local_hints(get_cmake_prefix_paths(os.environ.copy()), env=os.environ.copy())
-            print(f"=== [{name}] OK (presence verified) ===")
-            continue
+    prereqs = _dep_prerequisites(deps)
+    process = functools.partial(_process_dep, args=args, ctx=ctx)
+    if args.check_jobs > 0:
+        checks = _prerunnable_checks(selected, prereqs)
+        run_checks_concurrently(checks, prereqs, args.check_jobs, process)
+        selected = [d for d in selected if d not in checks]
+    run_dep_graph(selected, prereqs, args.jobs, process)
 
-        raise SystemExit(f"Unsupported dep kind '{kind}' for {name} in this script.")
+    _write_install_key(cmake_deps, args.config, args.native)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+"""
+Unit tests for pure helpers in scripts/build_deps.py.
+
+Run from the repository root:
+    python -m unittest discover -s tests/scripts
+"""
+
+import fnmatch
+import importlib.util
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+_SCRIPT = Path(__file__).resolve().parents[2] / "scripts" / "build_deps.py"
+_spec = importlib.util.spec_from_file_location("build_deps", _SCRIPT)
+build_deps = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(build_deps)
+
+
+class SplitCMakePathListTests(unittest.TestCase):
+    def test_windows_drive_letters_survive_round_trip(self):
+        value = "C:/Qt/6.5.0/msvc2019_64;D:/deps/_install"
+        with mock.patch.object(build_deps.platform, "system", return_value="Windows"):
+            parts = build_deps._split_cmake_path_list(value)
+        self.assertEqual(parts, ["C:/Qt/6.5.0/msvc2019_64", "D:/deps/_install"])
+        self.assertEqual(";".join(parts), value)
+
+    def test_posix_accepts_both_separators(self):
+        with mock.patch.object(build_deps.platform, "system", return_value="Linux"):
+            parts = build_deps._split_cmake_path_list("/opt/qt:/usr/local;/usr")
+        self.assertEqual(parts, ["/opt/qt", "/usr/local", "/usr"])
+
+    def test_empty_entries_and_none_are_dropped(self):
+        with mock.patch.object(build_deps.platform, "system", return_value="Windows"):
+            self.assertEqual(build_deps._split_cmake_path_list(";C:/Qt;;"), ["C:/Qt"])
+            self.assertEqual(build_deps._split_cmake_path_list(None), [])
+
+
+class ScanQtPrefixesTests(unittest.TestCase):
+    def test_windows_scan_keeps_x64_kits_and_skips_arm64(self):
+        root = r"C:\Qt"
+        kits = [
+            os.path.join(root, "6.5.0", "msvc2019_64"),
+            os.path.join(root, "6.8.1", "msvc2022_64"),
+            os.path.join(root, "6.8.1", "msvc2022_arm64"),
+        ]
+
+        def fake_glob(pattern):
+            return [k for k in kits if fnmatch.fnmatchcase(k, pattern)]
+
+        with mock.patch.object(build_deps.platform, "system", return_value="Windows"), \
+                mock.patch.object(build_deps.os.path, "isdir", return_value=True), \
+                mock.patch.object(build_deps.glob, "glob", side_effect=fake_glob), \
+                mock.patch.object(build_deps, "_qt6_dir_from_prefix", side_effect=lambda p: p):
+            found = build_deps._scan_qt_prefixes_uncached()
+
+        self.assertNotIn(os.path.join(root, "6.8.1", "msvc2022_arm64"), found)
+        self.assertEqual(found, (kits[1], kits[0]))  # newest Qt first
+
+
+class DepPrerequisitesTests(unittest.TestCase):
+    def test_scalar_depends_on_is_rejected_with_the_dep_name(self):
+        deps = [{"name": "Coin"}, {"name": "SoQt", "depends_on": "Coin"}]
+        with self.assertRaises(SystemExit) as cm:
+            build_deps._dep_prerequisites(deps)
+        self.assertIn("SoQt: depends_on must be a list", str(cm.exception))
+
+    def test_list_depends_on_and_sequential_default(self):
+        deps = [{"name": "Coin"}, {"name": "simage"}, {"name": "SoQt", "depends_on": ["Coin"]}]
+        self.assertEqual(build_deps._dep_prerequisites(deps),
+                         {"Coin": set(), "simage": {"Coin"}, "SoQt": {"Coin"}})
+
+
+@unittest.skipIf(os.name == "nt", "symlinks need extra privileges on Windows")
+class RemoveInstalledSymlinksTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        base = Path(tmp.name)
+        self.step = base / "_build" / "foo"
+        self.bld = self.step / "build"
+        (self.step / "src").mkdir(parents=True)
+        self.bld.mkdir()
+        lib = base / "_install" / "lib"
+        inc = base / "_install" / "include"
+        lib.mkdir(parents=True)
+        inc.mkdir()
+
+        (self.step / "src" / "foo.h").write_text("", encoding="utf-8")
+        (lib / "libfoo.so.1").write_text("", encoding="utf-8")
+        self.namelink = lib / "libfoo.so"
+        self.namelink.symlink_to("libfoo.so.1")  # relative, as a copy install makes it
+        self.header = inc / "foo.h"
+        self.header.symlink_to(self.step / "src" / "foo.h")  # absolute, from --symlink-install
+        (self.bld / "install_manifest.txt").write_text(
+            "\n".join(str(p) for p in (lib / "libfoo.so.1", self.namelink, self.header)), encoding="utf-8")
+
+    def test_keeps_relative_namelinks_and_drops_links_into_the_build_tree(self):
+        self.assertEqual(build_deps.remove_installed_symlinks(self.bld, self.step), 1)
+        self.assertTrue(self.namelink.is_symlink())
+        self.assertFalse(os.path.lexists(self.header))
+
+    def test_nothing_removed_after_a_recorded_copy_install(self):
+        (self.step / ".install-mode").write_text("copy", encoding="utf-8")
+        self.assertEqual(build_deps.drop_symlink_install(self.step, self.bld), 0)
+        self.assertTrue(self.header.is_symlink())
+
+
+if __name__ == "__main__":
+    unittest.main()